@@ -44,8 +44,12 @@ def check_in_same_sent(idxes, start, gene_start):
     return var_index == gene_index
 
 
-def process_body(idx, body, body_gene, body_var):  # pylint: disable=too-many-locals
+def process_body(idx, body, body_gene, body_var, offset=0):  # pylint: disable=too-many-locals
     """assign genes to variants in body text
+
+    `body` may be a window of the whole body starting at `offset`, the
+    mentions are then in offsets of the window and the results in offsets
+    of the whole body.
     """
     sent_idxes = get_sent_idxes(body)
 
@@ -60,12 +64,14 @@ def process_body(idx, body, body_gene, body_var):  # pylint: disable=too-many-lo
         gene_id, gene_mention, gene_start, gene_end = get_nearest_gene(genes, start, end)
         if not check_in_same_sent(sent_idxes, start, gene_start):
             gene_start, gene_end = -1, -1
+        else:
+            gene_start, gene_end = gene_start + offset, gene_end + offset
 
         result = Result(variant=var_mention, gene=gene_mention,
                         var_json=var_json, gene_id=gene_id,
                         file_idx=idx, in_table=False,
                         table_idx=-1, row=-1, col=-1,
-                        start=start, end=end,
+                        start=start + offset, end=end + offset,
                         gene_start=gene_start, gene_end=gene_end)
         results.append(result)
     return results
@@ -43,7 +43,8 @@ def process_table(file_idx, tables, body_gene, caption_gene, table_gene, table_v
         else:
             caption_gene_id, caption_gene_name = 0, ''
 
-        n, m = len(table['cells']), len(table['cells'][0])
+        # rows of spreadsheets are not padded to the same length
+        n, m = len(table['cells']), table['cells'].n_cols
         prev = [(0, '') for _ in range(m)]
 
         for i in range(n):
@@ -15,9 +15,15 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def process(pmid, body, tables, gene_extr):
-    gene_body_mentions = gene_extr.extract(body, pmid)
+def process(pmid, body, tables, gene_extr, context=None):
+    gene_body_mentions = gene_extr.extract(body, pmid, context)
+    gene_caption_mentions, gene_table_mentions = process_tables(pmid, tables, gene_extr)
+    return (gene_body_mentions,
+            gene_caption_mentions,
+            gene_table_mentions)
+
 
+def process_tables(pmid, tables, gene_extr):
     gene_caption_mentions = []
     gene_table_mentions = []
     for k, t in enumerate(tables):
@@ -26,14 +32,11 @@ def process(pmid, body, tables, gene_extr):
             for text, (start, end), gene in gene_extr.extract(caption, pmid):
                 gene_caption_mentions.append((text, k, (start, end), gene))
 
-        for i, row in enumerate(t['cells']):
-            for j, cell in enumerate(row):
-                mention = gene_extr.search_gene(cell['text'])
-                if not mention:
-                    continue
-                text, (start, end), gene = mention
-                gene_table_mentions.append((text, (k, i, j), (start, end), gene))
+        for i, j, cell_text in t['cells'].iter_cells():
+            mention = gene_extr.search_gene(cell_text)
+            if not mention:
+                continue
+            text, (start, end), gene = mention
+            gene_table_mentions.append((text, (k, i, j), (start, end), gene))
 
-    return (gene_body_mentions,
-            gene_caption_mentions,
-            gene_table_mentions)
+    return gene_caption_mentions, gene_table_mentions
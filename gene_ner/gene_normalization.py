@@ -1,6 +1,8 @@
 import re
 import csv
 import time
+import bisect
+from collections import OrderedDict
 
 # symbol_dict: symbol -> {name: gene_id}，gene_id為string，symbol都是一對一
 # synonym_dict: synonyms -> {name: [gene_ids]}
@@ -212,18 +214,86 @@ def find_near(test, test_list):
         return ''
 
 
-
-class GeneNormalizer:
-    def __init__(self, ref_file='/app/models/human_gene_data.csv'):
-        self.dicts = ref_dict(ref_file)
-
-    def normalize_one(self, text):
-        gene_id = self.normalize(text, [(0, len(text))])[0]
-        if gene_id:
-            return int(gene_id)
-        return None
+class NeighborIndex:
+    """offsets of the mentions sorted by end and by start
+
+    `find_near` returns the same as `find_near(test, test_list)` with bisect
+    instead of scanning the whole `test_list`.
+    """
+    def __init__(self, test_list):
+        refs = [(int(ref[0]), int(ref[1])) for ref in test_list]
+
+        by_end = sorted(range(len(refs)), key=lambda k: (refs[k][1], k))
+        self.ends = [refs[k][1] for k in by_end]
+        self.end_refs = [refs[k] for k in by_end]
+
+        by_start = sorted(range(len(refs)), key=lambda k: (refs[k][0], k))
+        self.starts = [refs[k][0] for k in by_start]
+        self.start_refs = [refs[k] for k in by_start]
+
+    def find_near(self, test, max_after=10000):
+        start = int(test[0])
+        end = int(test[1])
+
+        # 結束位置在start之前且最接近者，同樣位置取test_list中最前面的
+        before, before_near = 0, ''
+        k = bisect.bisect_left(self.ends, start) - 1
+        if k >= 0 and self.ends[k] > before:
+            k = bisect.bisect_left(self.ends, self.ends[k])
+            before = self.ends[k]
+            before_near = list(self.end_refs[k])
+
+        # 開始位置在end之後且最接近者
+        after, after_near = max_after, ''
+        k = bisect.bisect_right(self.starts, end)
+        if k < len(self.starts) and self.starts[k] < after:
+            after = self.starts[k]
+            after_near = list(self.start_refs[k])
+
+        if ((start-before) < (after-end)) & ((start-before) < 5):
+            return before_near
+        elif ((start-before) >= (after-end)) & ((after-end) < 5):
+            return after_near
+        else:
+            return ''
+
+
+class NormalizationContext:
+    """normalization state of one paper
+
+    The context can be fed the whole paper at once or block by block:
+    `current_dict` keeps the names resolved so far, `names` caches the
+    reference lookups (steps 2-6) of each name, and if `article` is the
+    whole paper its bag of words is built once and used for every block.
+    """
+    def __init__(self, normalizer, article=None):
+        self.normalizer = normalizer
+        self.article = article
+        self.current_dict = {}
+        self.names = {}
+        self._article_set = None
+        # mentions in a whole paper may be far beyond the 10000 of a block
+        self.max_after = 10000 if article is None else float('inf')
+
+    def lookup(self, test_name):
+        """return the reference lookup of the name, see `GeneNormalizer.lookup`
+        """
+        if test_name not in self.names:
+            self.names[test_name] = self.normalizer.lookup(test_name)
+        return self.names[test_name]
+
+    def get_article_set(self, article):
+        """bag of words of the paper if given, otherwise of the block
+        """
+        if self.article is None:
+            return set(name_normalize(article).split(' ')) - {'','the','of'}
+        if self._article_set is None:
+            self._article_set = set(name_normalize(self.article.lower()).split(' ')) - {'','the','of'}
+        return self._article_set
 
     def normalize(self, text, test_list):
+        """normalize the mentions at `test_list` offsets of the text to gene ids
+        """
         results = self.answer(text, '', test_list)
         tmp = []
         for ret in results:
@@ -235,14 +305,14 @@ class GeneNormalizer:
                 tmp.append(int(ret))
         return tmp
 
-
     def answer(self, title, abstract, test_list):
         # reference
-        symbol_dict, synonym_dict, multiple_name_dict, gene_id_set_dict, gene_id_multiple_dict = self.dicts
-        gene_id_key = list(gene_id_set_dict.keys())
+        gene_id_set_dict = self.normalizer.dicts[3]
 
         article = (title + '\n' + abstract).lower()
-        current_dict = {}
+        article_set = None
+        neighbors = None
+        current_dict = self.current_dict
         mulid_test_list = []
         noans_test_list = []
         final_data = []
@@ -254,8 +324,6 @@ class GeneNormalizer:
             test_start = test[0]
             test_end = test[1]
             test_name = article[test_start: test_end]
-            test_nor = name_normalize(test_name)
-            test_ns = re.sub('\s','',test_nor)
 
             # step 1: 從本篇paper中已經找好的test name著手
             possible_id = current_dict.get(test_name) # 若有，possible_id為string
@@ -263,64 +331,24 @@ class GeneNormalizer:
                 final_data.append(possible_id)
                 continue
 
-            # step 2: 從symbol_dict找完全對應者
-            possible_id = simple_find(test_ns, symbol_dict) # return a string or []
-            if possible_id != []:
-                current_dict[test_name] = possible_id
-                final_data.append(possible_id)
+            # step 2-6: 只用reference找，結果只和name有關
+            gene_id, candidate = self.lookup(test_name)
+            if gene_id:
+                current_dict[test_name] = gene_id
+                final_data.append(gene_id)
                 continue
-
-            # step 3: 從synonym_dict找完全對應者
-            possible_id = simple_find(test_ns, synonym_dict) # return a list
-            length = len(possible_id)
-            if length == 1:
-                current_dict[test_name] = possible_id[0]
-                final_data.append(possible_id[0])
-                continue
-            if length > 1:
+            if candidate:
+                mulid_test_list.append([test_start, test_end, test_name, candidate, i]) # 存進mulid_test_list
                 final_data.append('')
-                mulid_test_list.append([test_start, test_end, test_name, possible_id, i]) # 存進mulid_test_list
                 continue
 
-            # step 4: 從multiple_name_dict找完全對應者
-            possible_id = simple_find(test_ns, multiple_name_dict) # return a list
-            length = len(possible_id)
-            if length == 1:
-                current_dict[test_name] = possible_id[0]
-                final_data.append(possible_id[0])
-                continue
-            if length > 1:
-                mulid_test_list.append([test_start, test_end, test_name, possible_id, i]) # 存進mulid_test_list
-                final_data.append('')
-                continue
-
-            # step 5: 用word bag找最相關
-            possible_id = wordbag_find(test_nor, gene_id_set_dict, gene_id_key)
-            length = len(possible_id)
-            if length == 1:
-                current_dict[test_name] = possible_id[0]
-                final_data.append(possible_id[0])
-                continue
-            if length > 1:
-                # step 6: 每個name去比對，找出最相關的name（比word bag範圍還小）
-                possible_id2 = multiple_name_find(test_nor, possible_id, gene_id_multiple_dict)
-                length = len(possible_id2)
-                if length == 1:
-                    current_dict[test_name] = possible_id2[0]
-                    final_data.append(possible_id2[0])
-                    continue
-                if length > 1:
-                    mulid_test_list.append([test_start, test_end, test_name, possible_id, i]) # 存進mulid_test_list
-                    final_data.append('')
-                    continue
-
             # 剩餘的先視為no ans，最後再處理
             noans_test_list.append([test_start, test_end, test_name, '', i])
             final_data.append('')
 
 
         # 處理multiple
-        current_gene_id = list(current_dict.values())
+        current_gene_id = set(current_dict.values())
         mulid_test_list2 = []
 
         for test in mulid_test_list:
@@ -346,7 +374,8 @@ class GeneNormalizer:
 
             # step 8: 比對文章和gene_id_set_dict的相關性
             max_similar = 0
-            article_set = set(name_normalize(article).split(' ')) - {'','the','of'}
+            if article_set is None:
+                article_set = self.get_article_set(article)
             for gene_id in candidate:
                 gene_id_set = gene_id_set_dict[gene_id]
                 similar = len(article_set & gene_id_set)
@@ -369,7 +398,9 @@ class GeneNormalizer:
         for test in mulid_test_list2:
             test_name = test[2]
             position = test[4]
-            test_near = find_near(test, test_list)
+            if neighbors is None:
+                neighbors = NeighborIndex(test_list)
+            test_near = neighbors.find_near(test, self.max_after)
             if test_near != '':
                 test_near_name = article[test_near[0]: test_near[1]]
                 if current_dict.get(test_near_name):
@@ -385,7 +416,9 @@ class GeneNormalizer:
         for test in noans_test_list:
             test_name = test[2]
             position = test[4]
-            test_near = find_near(test, test_list)
+            if neighbors is None:
+                neighbors = NeighborIndex(test_list)
+            test_near = neighbors.find_near(test, self.max_after)
             if test_near != '':
                 test_near_name = article[test_near[0]: test_near[1]]
                 if current_dict.get(test_near_name):
@@ -399,6 +432,120 @@ class GeneNormalizer:
         return final_data
 
 
+class GeneNormalizer:
+    def __init__(self, ref_file='/app/models/human_gene_data.csv', name_cache_size=0):
+        """
+        Args:
+            ref_file: gene reference
+            name_cache_size: number of reference lookups cached across papers
+        """
+        self.dicts = ref_dict(ref_file)
+        self.gene_id_key = list(self.dicts[3].keys())
+        self.name_cache = OrderedDict()
+        self.name_cache_size = name_cache_size
+
+    def lookup(self, test_name):
+        """steps 2-6 of `answer`, which only depend on the name
+
+        Returns:
+            (gene_id, None) if resolved, (None, candidates) if ambiguous,
+            (None, None) if not found
+        """
+        if test_name in self.name_cache:
+            self.name_cache.move_to_end(test_name)
+            return self.name_cache[test_name]
+
+        ret = self._lookup(test_name)
+        if self.name_cache_size > 0:
+            self.name_cache[test_name] = ret
+            if len(self.name_cache) > self.name_cache_size:
+                self.name_cache.popitem(last=False)
+        return ret
+
+    def _lookup(self, test_name):
+        symbol_dict, synonym_dict, multiple_name_dict, gene_id_set_dict, gene_id_multiple_dict = self.dicts
+        test_nor = name_normalize(test_name)
+        test_ns = re.sub('\s','',test_nor)
+
+        # step 2: 從symbol_dict找完全對應者
+        possible_id = simple_find(test_ns, symbol_dict) # return a string or []
+        if possible_id != []:
+            return possible_id, None
+
+        # step 3: 從synonym_dict找完全對應者
+        possible_id = simple_find(test_ns, synonym_dict) # return a list
+        length = len(possible_id)
+        if length == 1:
+            return possible_id[0], None
+        if length > 1:
+            return None, possible_id
+
+        # step 4: 從multiple_name_dict找完全對應者
+        possible_id = simple_find(test_ns, multiple_name_dict) # return a list
+        length = len(possible_id)
+        if length == 1:
+            return possible_id[0], None
+        if length > 1:
+            return None, possible_id
+
+        # step 5: 用word bag找最相關
+        possible_id = wordbag_find(test_nor, gene_id_set_dict, self.gene_id_key)
+        length = len(possible_id)
+        if length == 1:
+            return possible_id[0], None
+        if length > 1:
+            # step 6: 每個name去比對，找出最相關的name（比word bag範圍還小）
+            possible_id2 = multiple_name_find(test_nor, possible_id, gene_id_multiple_dict)
+            length = len(possible_id2)
+            if length == 1:
+                return possible_id2[0], None
+            if length > 1:
+                return None, possible_id
+
+        return None, None
+
+    def exact_match(self, text):
+        """return the gene id if the name exactly matches a single gene, otherwise None
+
+        This is steps 2-4 of `answer`; when it returns a gene id,
+        `normalize_one` returns the same id.
+        """
+        symbol_dict, synonym_dict, multiple_name_dict, _, _ = self.dicts
+        test_ns = re.sub('\s', '', name_normalize(text.lower()))
+
+        possible_id = simple_find(test_ns, symbol_dict)
+        if possible_id != []:
+            return int(possible_id)
+
+        for name_dict in (synonym_dict, multiple_name_dict):
+            possible_id = simple_find(test_ns, name_dict)
+            if len(possible_id) == 1:
+                return int(possible_id[0])
+            if len(possible_id) > 1:
+                return None
+        return None
+
+    def normalize_one(self, text):
+        gene_id = self.normalize(text, [(0, len(text))])[0]
+        if gene_id:
+            return int(gene_id)
+        return None
+
+    def normalize(self, text, test_list):
+        return self.context().normalize(text, test_list)
+
+    def context(self, article=None):
+        """return a new normalization context for one paper
+
+        Args:
+            article: the whole paper, if the mentions are fed block by block
+        """
+        return NormalizationContext(self, article)
+
+    def answer(self, title, abstract, test_list):
+        return NormalizationContext(self).answer(title, abstract, test_list)
+
+
 def main():
     g = GeneNormalizer()
     title = 'TIF1gamma, a novel member of the transcriptional intermediary factor 1 family.'
@@ -1,30 +1,133 @@
+import os
 import re
+import sys
+import mmap
+import fcntl
+import tempfile
+import bisect
+import struct
+import logging
+from array import array
 
+logger = logging.getLogger(__name__)
 
-class Node:
-    def __init__(self, is_end=False, gene_id=''):
-        self.nxt = dict()
-        self.is_end = is_end
-        self.gene_id = gene_id
+MAGIC = b'V2LPT001'
+# magic, little endian, n_nodes, n_edges, n_tokens, vocab bytes, n_genes, gene bytes
+HEADER = struct.Struct('<8sBxxxIIIIII')
 
 
 class GenePrefixTree:
+    """prefix tree of CTD gene names stored as flat integer arrays
+
+    The children of node `n` are `edge_child[child_start[n]:child_start[n + 1]]`,
+    sorted by the interned token ids in `edge_token`. `node_gene[n]` is the index
+    of the gene id in `genes` if a gene name ends at `n`, otherwise -1.
+    Node 0 is the root.
+
+    The arrays are built once from `PT_CTDGene.txt` into `PT_CTDGene.txt.bin`
+    and memory-mapped afterwards, so workers share the pages. Workers starting
+    together build it once under a file lock, the others load the result.
+    """
     def __init__(self, path='/app/models/PT_CTDGene.txt'):
-        self.root = Node()
-        path_dict = {(): self.root}
+        bin_path = f'{path}.bin'
+        if self._is_stale(path, bin_path):
+            with open(f'{bin_path}.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if self._is_stale(path, bin_path):
+                    self._create_bin(path, bin_path)
+        self._load_bin(bin_path)
+
+    @staticmethod
+    def _is_stale(path, bin_path):
+        return not os.path.exists(bin_path) or (
+            os.path.exists(path) and os.path.getmtime(bin_path) < os.path.getmtime(path))
+
+    def _create_bin(self, infile, outfile):  # pylint: disable=too-many-locals
+        logger.info('creating %s ...', outfile)
+        vocab, genes = dict(), dict()
+        node_ids = {None: 0}
+        node_gene = array('i', [-1])
+        edges = dict()
 
-        with open(path) as f:
+        with open(infile) as f:
             f.read(1)
             for line in f:
                 fields = line.strip('\n').split('\t')
                 path, token = fields[:2]
                 is_end = len(fields) >= 3
-                gene_id = fields[2] if is_end else ''
 
-                idxes = tuple(path.split('-'))
-                parent = path_dict.get(idxes[:-1])
-                path_dict[idxes] = Node(is_end, gene_id)
-                parent.nxt[token] = path_dict[idxes]
+                parent = node_ids[path.rpartition('-')[0] if '-' in path else None]
+                node = len(node_gene)
+                node_ids[path] = node
+                node_gene.append(genes.setdefault(fields[2], len(genes)) if is_end else -1)
+                edges[(parent, vocab.setdefault(token, len(vocab)))] = node
+        del node_ids
+
+        n_nodes = len(node_gene)
+        child_start = array('i', [0]) * (n_nodes + 1)
+        edge_token, edge_child = array('i'), array('i')
+        for parent, token_id in sorted(edges):
+            edge_token.append(token_id)
+            edge_child.append(edges[(parent, token_id)])
+            child_start[parent + 1] += 1
+        for n in range(n_nodes):
+            child_start[n + 1] += child_start[n]
+
+        vocab_data = '\n'.join(vocab).encode('utf8')
+        genes_data = '\n'.join(genes).encode('utf8')
+
+        # written to a temporary file and renamed, so a mapped file is never rewritten
+        fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(outfile) or '.', prefix=os.path.basename(outfile))
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(HEADER.pack(MAGIC, sys.byteorder == 'little',
+                                       n_nodes, len(edge_token),
+                                       len(vocab), len(vocab_data),
+                                       len(genes), len(genes_data)))
+                for arr in (child_start, edge_token, edge_child, node_gene):
+                    fout.write(arr.tobytes())
+                fout.write(vocab_data)
+                fout.write(genes_data)
+            os.chmod(tmpfile, 0o644)
+            os.replace(tmpfile, outfile)
+        except Exception:
+            os.unlink(tmpfile)
+            raise
+
+    def _load_bin(self, filename):
+        with open(filename, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, little, n_nodes, n_edges,
+         n_tokens, vocab_len, n_genes, genes_len) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or bool(little) != (sys.byteorder == 'little'):
+            raise ValueError(f'{filename} is not a prefix tree built on this platform')
+
+        buf, offset = memoryview(self._mm), HEADER.size
+
+        def take(n):
+            nonlocal offset
+            view = buf[offset:offset + n]
+            offset += n
+            return view
+
+        self.child_start = take(4 * (n_nodes + 1)).cast('i')
+        self.edge_token = take(4 * n_edges).cast('i')
+        self.edge_child = take(4 * n_edges).cast('i')
+        self.node_gene = take(4 * n_nodes).cast('i')
+
+        tokens = str(take(vocab_len), 'utf8').split('\n') if n_tokens else []
+        self.vocab = {token: i for i, token in enumerate(tokens)}
+        self.genes = str(take(genes_len), 'utf8').split('\n') if n_genes else []
+
+    def _child(self, node, token_id):
+        if token_id < 0:
+            return -1
+        lo, hi = self.child_start[node], self.child_start[node + 1]
+        k = bisect.bisect_left(self.edge_token, token_id, lo, hi)
+        if k < hi and self.edge_token[k] == token_id:
+            return self.edge_child[k]
+        return -1
 
     def remove_punkt(self, tokens, offsets):
         new_tokens, new_offsets = [], []
@@ -36,13 +139,20 @@ class GenePrefixTree:
 
     def search_tokens(self, tokens, offsets):
         tokens, offsets = self.remove_punkt(tokens, offsets)
+        token_ids = [self.vocab.get(token.lower(), -1) for token in tokens]
+        child_start, edge_token, edge_child = self.child_start, self.edge_token, self.edge_child
+        node_gene, bisect_left = self.node_gene, bisect.bisect_left
+
         i, genes = 0, []
-        while i < len(tokens):
-            j, node = 0, self.root
+        while i < len(token_ids):
+            j, node = 0, 0
             start, end = i, None
-            while node and i + j < len(tokens):
-                node = node.nxt.get(tokens[i + j].lower(), None)
-                if node and node.is_end:
+            while node >= 0 and i + j < len(token_ids):
+                token_id = token_ids[i + j]
+                lo, hi = child_start[node], child_start[node + 1]
+                k = bisect_left(edge_token, token_id, lo, hi)
+                node = edge_child[k] if token_id >= 0 and k < hi and edge_token[k] == token_id else -1
+                if node >= 0 and node_gene[node] >= 0:
                     end = i + j
                 j += 1
 
@@ -53,12 +163,12 @@ class GenePrefixTree:
         return genes
 
     def search(self, tokens):
-        node = self.root
+        node = 0
         for token in tokens:
-            node = node.nxt.get(token, None)
-            if not node:
+            node = self._child(node, self.vocab.get(token, -1))
+            if node < 0:
                 return False
-        return node.is_end
+        return self.node_gene[node] >= 0
 
 
 if __name__ == '__main__':
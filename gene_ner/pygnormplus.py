@@ -17,35 +17,52 @@ logger = logging.getLogger(__name__)
 
 
 GENE_PT = GenePrefixTree()
+CELL_SEP_PATTERN = re.compile(r'[^0-9A-Za-z_.\'@+-]')
 
 
 class Extractor():
     """extract variant mentions
     """
 
-    def __init__(self):
+    def __init__(self, name_cache_size=0):
+        """
+        Args:
+            name_cache_size: number of gene name lookups cached across papers
+        """
         self.tagger = CRFPP.Tagger("-m /app/models/GNR.Model")
-        self.normalizer = GeneNormalizer()
+        self.normalizer = GeneNormalizer(name_cache_size=name_cache_size)
         self.stemmer = SnowballStemmer('english')
-        self.gene_dict = self.load_gene_symbols()
+        self.gene_symbols = self.load_gene_symbols()
+        self.symbol_gene_ids = dict()
 
     def load_gene_symbols(self):
-        genes = set()
+        """set of the gene symbols searched in table cells
+        """
         with open('/app/models/gene_symbols.txt') as f:
-            for line in f:
-                genes.add(line.strip('\n'))
-        return genes
+            return frozenset(line.strip('\n') for line in f)
+
+    def normalize_symbol(self, symbol):
+        """return the gene id of a symbol in `gene_symbols`
+
+        Symbols are resolved on first use, by an exact unambiguous match
+        or else by the normalizer, and cached across papers.
+        """
+        if symbol not in self.symbol_gene_ids:
+            gene_id = self.normalizer.exact_match(symbol)
+            if gene_id is None:
+                gene_id = self.normalizer.normalize_one(symbol)
+            self.symbol_gene_ids[symbol] = gene_id
+        return self.symbol_gene_ids[symbol]
 
     def search_gene(self, text):
-        text_ = re.sub(r'[^0-9A-Za-z_.\'@+-]', ' ', text)
+        text_ = CELL_SEP_PATTERN.sub(' ', text)
         for token in text_.split():
-            if token in self.gene_dict:
-                start = text.find(token)
-                end = start + len(token)
-                mention = text[start:end]
-                gene_id = self.normalizer.normalize_one(mention)
+            if token in self.gene_symbols:
+                gene_id = self.normalize_symbol(token)
                 if gene_id:
-                    return (mention, (start, end), gene_id)
+                    start = text.find(token)
+                    end = start + len(token)
+                    return (text[start:end], (start, end), gene_id)
         return None
 
     def filter_gene(self, mention):
@@ -56,8 +73,11 @@ class Extractor():
             return False
         return bool(GENE_PT.search(tokens))
 
-    def extract(self, text, filename):
+    def extract(self, text, filename, context=None):
         """extract variant mention from text lines
+
+        `context` is the normalization context of the paper if the text is a
+        part of it, see `context`.
         """
         cnt = 0
         offset, mention_offsets = 0, []
@@ -65,27 +85,24 @@ class Extractor():
             for start, end in self.extract_sent(line):
                 mention_offsets.append((start + offset, end + offset))
             offset += len(line) + 1
-        results = self.postprocess(text, mention_offsets)
+        results = self.postprocess(text, mention_offsets, context)
         return results
 
-    def _normalize(self, text, offsets, max_text_block=5000):
-        ret = []
-        j, n = 0, len(text)
-        for i in range(0, len(text), max_text_block):
-            block_offsets = []
-            max_end = i + max_text_block
-            while j < len(offsets) and offsets[j][0] < i + max_text_block:
-                block_offsets.append((offsets[j][0] - i, offsets[j][1] - i))
-                max_end = min(len(text), max(max_end, offsets[j][1]))
-                j += 1
-            if not block_offsets:
-                continue
-            ret += self.normalizer.normalize(text[i:max_end], block_offsets)
-        return ret
+    def context(self, article):
+        """return a normalization context of a paper shared by the parts of its text
+        """
+        return self.normalizer.context(article=article)
+
+    def _normalize(self, text, offsets, context=None):
+        # the whole paper shares one context: names resolved anywhere in the
+        # paper and its bag of words are used for every mention
+        if context is None:
+            context = self.context(text)
+        return context.normalize(text, offsets)
 
-    def postprocess(self, text, offsets):
+    def postprocess(self, text, offsets, context=None):
         # gene_ids = self.normalizer.normalize(text, offsets)
-        gene_ids = self._normalize(text, offsets)
+        gene_ids = self._normalize(text, offsets, context)
         ret = []
         for gene_id, (start, end) in zip(gene_ids, offsets):
             mention = text[start:end]
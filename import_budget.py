@@ -0,0 +1,149 @@
+"""check the import time of a worker against a budget
+
+Each mode imports what a worker of that mode loads, in a fresh interpreter:
+`main` and the readers of the formats it parses. The check fails if the
+imports take longer than the budget or load a module the mode does not need.
+The slowest imports of `python -X importtime` are printed (python 3.7+).
+
+As rpyc is imported only when the table detector is called, the detector
+client is also called once against a stub rpyc, so a missing import there
+fails the check instead of every pdf page.
+
+Usage:
+    python import_budget.py [--mode nxml-only] [--repeat 3] [--scale 1.0]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+# mode -> (modules imported, modules which must not be imported, budget in ms)
+MODES = {
+    'nxml-only': (
+        ['main', 'parse_data.markup'],
+        ['fitz', 'cv2', 'rpyc', 'torch', 'magic', 'docx', 'openpyxl', 'xlrd'],
+        2000,
+    ),
+    'no-table-detect': (
+        ['main', 'parse_data.markup', 'parse_data.pdf', 'parse_data.word', 'parse_data.sheet'],
+        ['rpyc', 'torch'],
+        3000,
+    ),
+}
+
+CODE = '''
+import sys, time, json
+t0 = time.perf_counter()
+import {modules}
+print(json.dumps({{'secs': time.perf_counter() - t0, 'modules': sorted(sys.modules)}}))
+'''
+
+DETECTOR_CODE = '''
+import sys, types
+import numpy as np
+from parse_data.utils import dump_np, load_np
+
+class Root:
+    def detect(self, data):
+        return dump_np(np.array([[10., 20., 30., 40., 0.9]]))
+    def detect_array(self, data):
+        height, width = load_np(data).shape[:2]
+        return dump_np(np.array([[0., 0., width, height, 0.9]]))
+
+class Conn:
+    root = Root()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+
+sys.modules['rpyc'] = types.SimpleNamespace(connect=lambda **kwargs: Conn())
+import os
+os.environ.setdefault('LOAD_BALANCER_HOST', 'localhost')
+from parse_data.pdf_utils import find_tables, find_tables_in_image
+
+assert [list(box) for box in find_tables(b'')] == [[10., 20., 30., 40., 0.9]]
+boxes = find_tables_in_image(np.zeros((1100, 850, 3), np.uint8))
+assert len(boxes) == 1 and abs(boxes[0][2] - 850) < 2 and abs(boxes[0][3] - 1100) < 2, boxes
+'''
+
+
+def parse_importtime(stderr):
+    """return [(cumulative us, module)] of the imports in `-X importtime` output
+
+    Only the modules imported at the top level and directly by them are returned.
+    """
+    ret = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # nested imports are indented by two spaces per level
+        if len(name) - len(name.lstrip(' ')) <= 3:
+            ret.append((int(parts[1]), name.rstrip()))
+    return ret
+
+
+def measure(modules):
+    """return (seconds, imported modules, top-level import times) of a fresh interpreter
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE.format(modules=', '.join(modules))],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    ret = json.loads(proc.stdout.strip().splitlines()[-1])
+    return ret['secs'], set(ret['modules']), parse_importtime(proc.stderr)
+
+
+def check(mode, repeat=3, scale=1.0, top=10):
+    """return True if the imports of the mode are within the budget
+    """
+    modules, forbidden, budget_ms = MODES[mode]
+    budget_ms *= scale
+    runs = [measure(modules) for _ in range(repeat)]
+    secs, loaded, times = min(runs, key=lambda run: run[0])
+
+    ok = True
+    unwanted = sorted(name for name in forbidden if name in loaded)
+    if unwanted:
+        print(f'{mode}: imports {", ".join(unwanted)}')
+        ok = False
+    if secs * 1000 > budget_ms:
+        print(f'{mode}: {secs * 1000:.0f} ms, over the budget of {budget_ms:.0f} ms')
+        ok = False
+    else:
+        print(f'{mode}: {secs * 1000:.0f} ms, budget {budget_ms:.0f} ms')
+
+    for us, name in sorted(times, reverse=True)[:top]:
+        print(f'    {us / 1000:8.1f} ms {name}')
+    return ok
+
+
+def check_detector():
+    """return True if the table detector client works against a stub rpyc
+    """
+    proc = subprocess.run([sys.executable, '-c', DETECTOR_CODE],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        print(f'table detector client: failed\n{proc.stderr}')
+        return False
+    print('table detector client: ok')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', type=str, choices=sorted(MODES), default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the budgets, for slower machines')
+    args = parser.parse_args()
+
+    modes = [args.mode] if args.mode else sorted(MODES)
+    results = [check(mode, args.repeat, args.scale) for mode in modes]
+    results.append(check_detector())
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -31,10 +31,17 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--n-process", type=int, default=1)
     parser.add_argument("--loglevel", type=str, default='INFO')
     parser.add_argument("--input", type=str, default='/app/input')
+    parser.add_argument("--gene-name-cache", type=int, default=0, dest='gene_name_cache')
+    parser.add_argument("--vcf-cache", type=int, default=0, dest='vcf_cache')
+    parser.add_argument("--vcf-cache-path", type=str, default=None, dest='vcf_cache_path')
+    parser.add_argument("--vcf-cache-map-mb", type=int, default=1024, dest='vcf_cache_map_mb')
 
     parser.set_defaults(nxml_only=False)
     parser.add_argument("--nxml-only", action='store_true', dest='nxml_only')
 
+    parser.set_defaults(async_write=False)
+    parser.add_argument("--async-write", action='store_true', dest='async_write')
+
     parser.set_defaults(table_detect=True)
     parser.add_argument("--no-table-detect", action='store_false', dest='table_detect')
 
@@ -42,26 +49,81 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+BODY_WINDOW_SIZE = 100000
+GENE_CONTEXT_SIZE = 10000
+
+
+@timeout(180)
+def extract_window(_id, idx, body, window, var_extr, gene_extr, gene_context):  # pylint: disable=too-many-arguments
+    """process a window of the body, see `parse_data.body_windows`
+
+    Variants are extracted from the window, genes also from its context so
+    that the variants near the edges are assigned the genes next to them.
+    Returns the results and the gene mentions in the window, in offsets of the body.
+    """
+    start, end, context_start, context_end = window
+    text = body[context_start:context_end]
+
+    shift = start - context_start
+    body_var = [(mention, (s + shift, e + shift), var_json)
+                for mention, (s, e), var_json in var_extr.extract(body[start:end], _id)]
+    body_gene = gene_extr.extract(text, _id, gene_context)
+
+    results = assign_gene.process_body(idx, text, body_gene, body_var, offset=context_start)
+    window_gene = [(mention, (s + context_start, e + context_start), gene_id)
+                   for mention, (s, e), gene_id in body_gene
+                   if start <= s + context_start < end]
+    return results, window_gene
+
+
 @timeout(180)
-def extract(_id, idx, data, var_extr, gene_extr):  # pylint: disable=too-many-locals
+def extract_tables(_id, idx, tables, body_gene, var_extr, gene_extr):
+    """process the tables of a paper
+    """
+    table_var = var_ner.process_tables(_id, tables, var_extr)
+    caption_gene, table_gene = gene_ner.process_tables(_id, tables, gene_extr)
+    return assign_gene.process_table(idx, tables, body_gene, caption_gene, table_gene, table_var)
+
+
+def extract(_id, idx, data, var_extr, gene_extr):
     """process a paper
+
+    The body is processed in windows of about BODY_WINDOW_SIZE characters
+    with GENE_CONTEXT_SIZE characters of gene context, each within the
+    timeout, so long bodies are processed in full.
+
+    A timed out window keeps running in its thread with the extractors and
+    the gene context, so the file is not processed further: the results of
+    the windows before it are returned.
     """
-    body_var, table_var = var_ner.process(_id, data.body, data.tables, var_extr)
-    body_gene, caption_gene, table_gene = gene_ner.process(_id, data.body, data.tables, gene_extr)
+    gene_context = gene_extr.context(data.body)
+    body_results, body_gene = [], []
+    for window in parse_data.body_windows(data.body, BODY_WINDOW_SIZE, GENE_CONTEXT_SIZE):
+        try:
+            results, genes = extract_window(_id, idx, data.body, window, var_extr, gene_extr, gene_context)
+        except TimeoutError:
+            logger.info(f'timeout {_id} {idx} body {window[0]}-{window[1]}, skipping the rest of the file')
+            return body_results
+        body_results += results
+        body_gene += genes
 
-    body_results = assign_gene.process_body(idx, data.body, body_gene, body_var)
-    table_results = assign_gene.process_table(idx, data.tables, body_gene, caption_gene,
-                                              table_gene, table_var)
-    results = body_results + table_results
-    return results
+    try:
+        table_results = extract_tables(_id, idx, data.tables, body_gene, var_extr, gene_extr)
+    except TimeoutError:
+        logger.info(f'timeout {_id} {idx} tables')
+        table_results = []
+    return body_results + table_results
 
 
 def worker(que, args):  # pylint: disable=too-many-locals
     """worker for one process
     """
     var_extr = var_ner.pytmvar.Extractor()
-    gene_extr = gene_ner.pygnormplus.Extractor()
-    var_normalizer = VarNormalizer()
+    gene_extr = gene_ner.pygnormplus.Extractor(name_cache_size=args.gene_name_cache)
+    var_normalizer = VarNormalizer(cache_size=args.vcf_cache, cache_path=args.vcf_cache_path,
+                                   cache_map_size=args.vcf_cache_map_mb << 20)
+
+    writer = normalize_var.AsyncWriter() if args.async_write else None
 
     logger.info('init OK')
 
@@ -69,7 +131,7 @@ def worker(que, args):  # pylint: disable=too-many-locals
         try:
             msg = que.get(timeout=10)
         except queue.Empty:
-            return
+            break
 
         _id, dir_path = msg
 
@@ -83,17 +145,19 @@ def worker(que, args):  # pylint: disable=too-many-locals
                                              save_data=False)
 
             results = []
-            for idx, filename, data in parsed_data:
-                try:
-                    results += extract(_id, idx, data, var_extr, gene_extr)
-                except TimeoutError:
-                    logger.info(f'timeout {_id} {filename}')
+            for idx, _, data in parsed_data:
+                results += extract(_id, idx, data, var_extr, gene_extr)
 
-            normalize_var.process(results, _id, var_normalizer)
+            normalize_var.process(results, _id, var_normalizer, writer)
         except Exception:
             traceback.print_exc()
 
         logger.info('end processing {}: {:.3f} secs'.format(_id, time.time() - t0))
+        if var_normalizer.cache is not None:
+            var_normalizer.cache.log_stats()
+
+    if writer is not None:
+        writer.close()
 
 
 def main():
@@ -0,0 +1,202 @@
+# pylint: disable=invalid-name
+"""load gene, transcript and rsid tables with LOAD DATA LOCAL INFILE
+
+The rows are streamed through a named pipe, so no TSV file is written.
+The tables are loaded in parallel processes with their non-unique indexes
+disabled, and rebuilt once at the end. The progress is committed to the
+`load_status` table after each chunk; running again resumes from there.
+
+Usage:
+    cd mysqldb && python bulk_load.py
+"""
+import os
+import time
+import logging
+import tempfile
+import threading
+import multiprocessing
+from itertools import islice
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Index
+from sqlalchemy.types import Integer, BigInteger, String
+from sqlalchemy.pool import NullPool
+
+from models import (metadata, gene, transcript, rsid, read_genes, read_rsids,
+                    create_db, host, port, passwd)
+from join_gene_name_and_id import get_transcripts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+status_metadata = MetaData()
+
+load_status = Table(
+    'load_status', status_metadata,
+    Column('name', String(50), primary_key=True),
+    Column('lines', BigInteger(), nullable=False, default=0),
+    Column('max_id', BigInteger(), nullable=False, default=0),
+    Column('done', Integer(), nullable=False, default=0),
+    mysql_engine='MyISAM',
+)
+
+CHUNK_SIZE = 10000000
+
+
+def tsv_value(value):
+    """format a value for LOAD DATA with the default escaping
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class Loader:
+    """load one table from a row generator
+
+    Args:
+        table: sqlalchemy table
+        columns: columns in the order of the rows
+        read_rows: function returning the rows, tuples or dicts
+        id_column: auto increment column used to resume a partially
+            loaded table, otherwise the table is reloaded from the start
+        indexes: indexes created before loading, if not yet created
+    """
+    def __init__(self, table, columns, read_rows, id_column=None, indexes=()):  # pylint: disable=too-many-arguments
+        self.table = table
+        self.columns = columns
+        self.read_rows = read_rows
+        self.id_column = id_column
+        self.indexes = indexes
+        self.engine = None
+
+    @property
+    def name(self):
+        return self.table.name
+
+    def connect(self):
+        """return a Connection object allowing LOAD DATA LOCAL INFILE
+        """
+        if self.engine is None:
+            self.engine = create_engine(f'mysql+pymysql://root:{passwd}@{host}:{port}/gene',
+                                        poolclass=NullPool, connect_args={'local_infile': True})
+        return self.engine.connect()
+
+    def get_status(self, conn):
+        row = conn.execute(load_status.select().where(load_status.c.name == self.name)).fetchone()
+        if row is None:
+            conn.execute(load_status.insert(), name=self.name)  # pylint: disable=no-value-for-parameter
+            return 0, 0, False
+        return row.lines, row.max_id, bool(row.done)
+
+    def set_status(self, conn, lines, max_id, done=False):
+        conn.execute(load_status.update().where(load_status.c.name == self.name)  # pylint: disable=no-value-for-parameter
+                     .values(lines=lines, max_id=max_id, done=int(done)))
+
+    def prepare(self, conn, lines, max_id):
+        """drop rows of an unfinished chunk, return the number of lines to skip
+        """
+        existing = {row[2] for row in conn.execute(f'SHOW INDEX FROM `{self.name}`')}
+        for index in self.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+
+        if self.id_column is None or lines == 0:
+            conn.execute(f'TRUNCATE `{self.name}`')
+            return 0
+        conn.execute(f'DELETE FROM `{self.name}` WHERE `{self.id_column}` > %s', (max_id,))
+        return lines
+
+    def write_pipe(self, path, rows, progress):
+        try:
+            with open(path, 'w') as fout:
+                for row in rows:
+                    if isinstance(row, dict):
+                        row = [row[column] for column in self.columns]
+                    fout.write('\t'.join(map(tsv_value, row)))
+                    fout.write('\n')
+                    progress[0] += 1
+        except Exception as e:  # pylint: disable=broad-except
+            progress[1] = e
+
+    def load_chunk(self, conn, rows):
+        """load rows through a named pipe, return the number of rows read
+        """
+        progress = [0, None]  # rows written, exception of the writer
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, f'{self.name}.tsv')
+            os.mkfifo(path)
+            writer = threading.Thread(target=self.write_pipe, args=(path, rows, progress), daemon=True)
+            writer.start()
+            columns = ', '.join(f'`{column}`' for column in self.columns)
+            conn.execute(f"LOAD DATA LOCAL INFILE '{path}' IGNORE INTO TABLE `{self.name}` "
+                         f"CHARACTER SET utf8 FIELDS TERMINATED BY '\\t' ({columns})")
+            writer.join()
+        if progress[1] is not None:
+            raise progress[1]
+        return progress[0]
+
+    def run(self):
+        """load the table, skipping the chunks already loaded
+        """
+        t0 = time.time()
+        with self.connect() as conn:
+            lines, max_id, done = self.get_status(conn)
+            if done:
+                logger.info('%s already loaded', self.name)
+                return
+
+            lines = self.prepare(conn, lines, max_id)
+            logger.info('loading %s from line %d ...', self.name, lines)
+            conn.execute(f'ALTER TABLE `{self.name}` DISABLE KEYS')
+
+            rows = islice(iter(self.read_rows()), lines, None)
+            chunk_size = CHUNK_SIZE if self.id_column else None
+            n_loaded = 0
+            while True:
+                n = self.load_chunk(conn, islice(rows, chunk_size))
+                lines += n
+                n_loaded += n
+                if self.id_column:
+                    max_id = conn.execute(f'SELECT MAX(`{self.id_column}`) FROM `{self.name}`').scalar() or 0
+                self.set_status(conn, lines, max_id)
+                logger.info('%s: %d rows, %.0f rows/sec', self.name, lines,
+                            n_loaded / max(time.time() - t0, 1e-6))
+                if chunk_size is None or n < chunk_size:
+                    break
+
+            logger.info('%s: rebuilding indexes ...', self.name)
+            conn.execute(f'ALTER TABLE `{self.name}` ENABLE KEYS')
+            self.set_status(conn, lines, max_id, done=True)
+        logger.info('%s loaded: %d rows, %.1f secs', self.name, lines, time.time() - t0)
+
+
+LOADERS = [
+    Loader(gene, ['id', 'symbol', 'chrom'], read_genes),
+    Loader(transcript, ['name', 'chrom', 'strand', 'tx_start', 'tx_end', 'cds_start', 'cds_end',
+                        'exon_starts', 'exon_ends', 'gene_id'], get_transcripts),
+    Loader(rsid, ['name', 'chrom', 'start', 'end', 'ref', 'observed'], read_rsids,
+           id_column='_id', indexes=[Index('idx_name', rsid.c.name)]),
+]
+
+
+def main():
+    """load all tables in parallel
+    """
+    create_db()
+    engine = create_engine(f'mysql+pymysql://root:{passwd}@{host}:{port}/gene', poolclass=NullPool)
+    metadata.create_all(engine)
+    status_metadata.create_all(engine)
+
+    ps = [multiprocessing.Process(target=loader.run) for loader in LOADERS]
+    for p in ps:
+        p.start()
+    for p in ps:
+        p.join()
+
+    failed = [loader.name for loader, p in zip(LOADERS, ps) if p.exitcode != 0]
+    if failed:
+        raise SystemExit(f'failed to load {", ".join(failed)}, run again to resume')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""migrate var_pmid from the string primary key schema to the compact schema
+
+The old table is renamed to `var_pmid_v1` and copied into the new
+`var_pmid` in chunks of papers; running again continues with the papers
+not yet copied. The sizes of both tables and the latency of variant and
+position queries are printed at the end.
+
+Usage:
+    cd mysqldb && python migrate_var_pmid.py [--drop]
+"""
+import sys
+import time
+import random
+import logging
+
+from models import engine, metadata
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OLD_TABLE = 'var_pmid_v1'
+
+COPY_QUERY = f'''
+INSERT INTO var_pmid
+    (var_key, chrom, position, ref, alt, gene_id, transcript, paper_id,
+     file_idx, in_table, table_idx, `row`, col, start, `end`, mention, gene_start, gene_end)
+SELECT
+    CONV(LEFT(SHA1(CONCAT_WS(':', v.chrom, v.position, v.ref, v.alt)), 15), 16, 10),
+    v.chrom, CAST(v.position AS UNSIGNED), v.ref, v.alt, v.gene_id, v.transcript, p.id,
+    v.file_idx, v.in_table, v.table_idx, v.`row`, v.col, v.start, v.`end`, v.mention, v.gene_start, v.gene_end
+FROM {OLD_TABLE} v JOIN paper p ON p._id = v._id
+WHERE p.id > %s AND p.id <= %s
+'''
+
+
+def table_exists(conn, name):
+    return conn.execute('SHOW TABLES LIKE %s', (name,)).fetchone() is not None
+
+
+def has_column(conn, table, column):
+    return conn.execute(f'SHOW COLUMNS FROM `{table}` LIKE %s', (column,)).fetchone() is not None
+
+
+def migrate(chunk_size=1000):
+    """copy the old table into the new schema
+    """
+    with engine.connect() as conn:
+        if table_exists(conn, 'var_pmid') and has_column(conn, 'var_pmid', '_id'):
+            logger.info('renaming var_pmid to %s', OLD_TABLE)
+            conn.execute(f'RENAME TABLE var_pmid TO {OLD_TABLE}')
+        if not table_exists(conn, OLD_TABLE):
+            logger.info('%s not found, nothing to migrate', OLD_TABLE)
+            return
+        metadata.create_all(engine)
+
+        conn.execute(f'INSERT IGNORE INTO paper (_id) SELECT DISTINCT _id FROM {OLD_TABLE}')
+        # each chunk is one InnoDB statement, so papers up to the max are fully copied
+        done = conn.execute('SELECT MAX(paper_id) FROM var_pmid').scalar() or 0
+        last = conn.execute('SELECT MAX(id) FROM paper').scalar() or 0
+
+        t0, n_rows = time.time(), 0
+        for start in range(done, last, chunk_size):
+            n_rows += conn.execute(COPY_QUERY, (start, start + chunk_size)).rowcount
+            logger.info('papers %d/%d, %d rows, %.0f rows/sec', min(start + chunk_size, last), last,
+                        n_rows, n_rows / max(time.time() - t0, 1e-6))
+
+
+def report(n_samples=100):
+    """print table sizes and query latencies of the old and the new table
+    """
+    with engine.connect() as conn:
+        for table in (OLD_TABLE, 'var_pmid'):
+            if not table_exists(conn, table):
+                continue
+            n_rows, data_len, index_len = conn.execute(
+                'SELECT table_rows, data_length, index_length FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', (table,)).fetchone()
+            print(f'{table}: ~{n_rows} rows, data {data_len / 2**20:.1f} MB, index {index_len / 2**20:.1f} MB')
+
+        variants = conn.execute('SELECT chrom, position, ref, alt, var_key FROM var_pmid '
+                                'ORDER BY RAND() LIMIT %s', (n_samples,)).fetchall()
+        if not variants:
+            return
+        random.shuffle(variants)
+        queries = [
+            ('var_pmid by var_key', 'SELECT * FROM var_pmid WHERE var_key = %s AND chrom = %s '
+             'AND position = %s AND ref = %s AND alt = %s', lambda v: (v[4], v[0], v[1], v[2], v[3])),
+            ('var_pmid by region', 'SELECT * FROM var_pmid WHERE chrom = %s '
+             'AND position BETWEEN %s AND %s', lambda v: (v[0], v[1] - 1000, v[1] + 1000)),
+        ]
+        if table_exists(conn, OLD_TABLE):
+            queries.append((f'{OLD_TABLE} by variant', f'SELECT * FROM {OLD_TABLE} WHERE chrom = %s '
+                            'AND position = %s AND ref = %s AND alt = %s',
+                            lambda v: (v[0], str(v[1]), v[2], v[3])))
+        for name, query, params in queries:
+            t0 = time.time()
+            for v in variants:
+                conn.execute(query, params(v)).fetchall()
+            print(f'{name}: {(time.time() - t0) / len(variants) * 1000:.2f} ms/query')
+
+
+def main():
+    migrate()
+    report()
+    if '--drop' in sys.argv[1:]:
+        with engine.connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {OLD_TABLE}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 """models for tables in mysql
 """
 import gzip
+import hashlib
 import os
 import csv
 import logging
@@ -40,21 +41,31 @@ Index('idx_pmid', paper_status.c.pmid)
 Index('idx_pmcid', paper_status.c.pmcid)
 Index('idx_status', paper_status.c.status)
 
+paper = Table(
+    'paper', metadata,
+    Column('id', Integer(), primary_key=True, autoincrement=True),
+    Column('_id', String(50), nullable=False, unique=True),
+    Column('version', Integer(), nullable=False, server_default='0'),
+    mysql_engine='InnoDB',
+)
+
 var_pmid = Table(
     'var_pmid', metadata,
-    Column('chrom', String(50), primary_key=True),
-    Column('position', String(50), primary_key=True),
-    Column('ref', String(200), primary_key=True),
-    Column('alt', String(200), primary_key=True),
+    Column('id', BigInteger(), primary_key=True, autoincrement=True),
+    Column('var_key', BigInteger(), nullable=False),
+    Column('chrom', String(50), nullable=False),
+    Column('position', Integer(), nullable=False),
+    Column('ref', String(200), nullable=False),
+    Column('alt', String(200), nullable=False),
     Column('gene_id', Integer(), nullable=False),
     Column('transcript', String(50), nullable=False),
-    Column('_id', String(50), primary_key=True),
-    Column('file_idx', Integer(), primary_key=True),
-    Column('in_table', Integer(), primary_key=True),
-    Column('table_idx', Integer(), primary_key=True),
-    Column('row', Integer(), primary_key=True),
-    Column('col', Integer(), primary_key=True),
-    Column('start', Integer(), primary_key=True),
+    Column('paper_id', Integer(), nullable=False),
+    Column('file_idx', Integer(), nullable=False),
+    Column('in_table', Integer(), nullable=False),
+    Column('table_idx', Integer(), nullable=False),
+    Column('row', Integer(), nullable=False),
+    Column('col', Integer(), nullable=False),
+    Column('start', Integer(), nullable=False),
     Column('end', Integer(), nullable=False),
     Column('mention', String(200), nullable=False),
     Column('gene_start', Integer(), nullable=False),
@@ -62,12 +73,22 @@ var_pmid = Table(
     mysql_engine='InnoDB',
 )
 
-Index('idx_paper_id', var_pmid.c._id)
+Index('idx_paper_id', var_pmid.c.paper_id)
 Index('idx_gene', var_pmid.c.gene_id)
-Index('idx_var', var_pmid.c.chrom, var_pmid.c.position,
-      var_pmid.c.ref, var_pmid.c.alt)
+Index('idx_var', var_pmid.c.var_key)
 Index('idx_pos', var_pmid.c.chrom, var_pmid.c.position)
 
+
+def variant_key(chrom, position, ref, alt):
+    """return the BIGINT key of a chromosome variant
+
+    The same as `CONV(LEFT(SHA1(CONCAT_WS(':', chrom, position, ref, alt)), 15), 16, 10)`
+    in mysql, so keys can be computed in SQL when migrating.
+    """
+    data = f'{chrom}:{position}:{ref}:{alt}'.encode('utf8')
+    return int(hashlib.sha1(data).hexdigest()[:15], 16)
+
+
 rsid = Table(
     'rsid', metadata,
     Column('_id', Integer(), primary_key=True, autoincrement=True),
@@ -143,20 +164,23 @@ class PaperStatusCnt:
         self.cnt = cnt
 
 
-class VarPmid:
+class VarPmid:  # pylint: disable=too-many-instance-attributes
     """variant to paper
     """
-    def __init__(self, chrom, position, ref, alt,  # pylint: disable=too-many-arguments
-                 gene_id, transcript, pmid, file_idx,
+    def __init__(self, row_id, var_key, chrom, position, ref, alt,  # pylint: disable=too-many-arguments, too-many-locals
+                 gene_id, transcript, paper_id, file_idx,
                  in_table, table_idx, row, col,
-                 start, end, mention, gene_start, gene_end):
+                 start, end, mention, gene_start, gene_end, pmid=None):
 
+        self.row_id = row_id
+        self.var_key = var_key
         self.chrom = chrom
         self.position = position
         self.ref = ref
         self.alt = alt
         self.gene_id = gene_id
         self.transcript = transcript
+        self.paper_id = paper_id
         self.pmid = pmid
         self.file_idx = file_idx
         self.in_table = in_table
@@ -222,7 +246,22 @@ class Pubmed:
         self.title = title
 
 
-def insert_rsid(engine):  # pylint: disable=too-many-locals
+def read_rsids(path='/app/models/snp150.txt.gz'):
+    """yield (name, chrom, start, end, ref, observed) of snp150
+    """
+    with gzip.open(path) as f:
+        for line in f:
+            row = line.decode('ascii').split('\t', 10)
+            name = row[4][2:]
+            chrom = row[1]
+            start = int(row[2])
+            end = int(row[3])
+            ref = row[7]
+            observed = row[9]
+            yield (name, chrom, start, end, ref, observed)
+
+
+def insert_rsid(engine):
     """insert rsid into database
     """
 
@@ -231,19 +270,11 @@ def insert_rsid(engine):  # pylint: disable=too-many-locals
              'VALUES (%s, %s, %s, %s, %s, %s)')
 
     t = time.time()
-    with gzip.open('/app/models/snp150.txt.gz') as f, engine.connect() as conn:
+    with engine.connect() as conn:
         conn.execute('truncate rsid')
         values, i = [], -1
-        for i, line in enumerate(f):
-            row = line.decode('ascii').split('\t', 10)
-            name = row[4][2:]
-            chrom = row[1]
-            start = int(row[2])
-            end = int(row[3])
-            ref = row[7]
-            observed = row[9]
-
-            values.append((name, chrom, start, end, ref, observed))
+        for i, row in enumerate(read_rsids()):
+            values.append(row)
 
             if (i + 1) % 100000 == 0:
                 conn.execute(query, values)
@@ -254,7 +285,6 @@ def insert_rsid(engine):  # pylint: disable=too-many-locals
         print(i + 1, 'rsid inserted', time.time() - t)
 
 
-
 def insert_transcripts(engine):
     """insert transcripts into database
     """
@@ -279,23 +309,31 @@ def insert_transcripts(engine):
         print(i + 1, 'transcripts inserted', time.time() - t)
 
 
+def read_genes(path='/app/models/Homo_sapiens.gene_info.gz'):
+    """yield rows of the gene table from NCBI gene_info
+    """
+    with gzip.open(path) as f:
+        f.readline()
+        for line in f:
+            row = line.decode('ascii').split('\t')
+            yield {
+                'id': row[1],
+                'symbol': row[2],
+                'chrom': row[6],
+            }
+
+
 def insert_genes(engine):
     """insert transcripts into database
     """
 
     t = time.time()
-    with gzip.open('/app/models/Homo_sapiens.gene_info.gz') as f, engine.connect() as conn:
+    with engine.connect() as conn:
         conn.execute('truncate gene')
-        f.readline()
 
         values, i = [], -1
-        for i, line in enumerate(f):
-            row = line.decode('ascii').split('\t')
-            values.append({
-                'id': row[1],
-                'symbol': row[2],
-                'chrom': row[6],
-            })
+        for i, row in enumerate(read_genes()):
+            values.append(row)
 
             if (i + 1) % 10000 == 0:
                 conn.execute(gene.insert(), values)  # pylint: disable=no-value-for-parameter
@@ -7,14 +7,18 @@ import argparse
 import multiprocessing
 import json
 import time
+import queue
 import logging
+import threading
+import traceback
 from typing import NamedTuple
 
 from sqlalchemy import create_engine
+from sqlalchemy.sql import select
 
 sys.path.insert(0, '/app/mysqldb')
 from models import (engine,  # pylint: disable=no-name-in-module, wrong-import-position
-                    var_pmid)
+                    paper, var_pmid, variant_key)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -36,45 +40,111 @@ class IndexKey(NamedTuple):
     start: int
 
 
-def write_mysql(_id, values):
-    """write data into mysql db
+_pooled_engine = None
+
+
+def get_engine():
+    """return an engine of the same database reusing its connections
+    """
+    global _pooled_engine  # pylint: disable=global-statement
+    if _pooled_engine is None:
+        _pooled_engine = create_engine(engine.url, pool_size=1, pool_pre_ping=True)
+    return _pooled_engine
+
+
+def get_paper_id(conn, _id):
+    """return the integer id of the paper, inserting it if new
+
+    The version of the paper is increased, so cached query results of it are invalidated.
+    """
+    conn.execute(paper.insert().prefix_with('IGNORE'), _id=_id, version=0)  # pylint: disable=no-value-for-parameter
+    conn.execute(paper.update().where(paper.c._id == _id)  # pylint: disable=no-value-for-parameter
+                 .values(version=paper.c.version + 1))
+    return conn.execute(select([paper.c.id]).where(paper.c._id == _id)).scalar()
+
+
+def write_mysql(_id, values, batch_size=5000):
+    """replace the rows of the paper in one transaction
     """
-    with engine.connect() as conn:
-        conn.execute(var_pmid.delete().where(var_pmid.c._id == _id))
-        for i in range(0, len(values), 1000):
-            batch = values[i:i + 1000]
-            conn.execute(var_pmid.insert(), batch)  # pylint: disable=no-value-for-parameter
+    with get_engine().begin() as conn:
+        paper_id = get_paper_id(conn, _id)
+        for value in values:
+            value['paper_id'] = paper_id
+        conn.execute(var_pmid.delete().where(var_pmid.c.paper_id == paper_id))
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            conn.execute(var_pmid.insert().values(batch))  # pylint: disable=no-value-for-parameter
 
 
-def process(results, _id, var_normalizer):  # pylint: disable=too-many-locals
+class AsyncWriter:
+    """write papers into mysql in a background thread
+
+    `submit` waits only while the previous paper is still being written,
+    so the extraction of the next paper overlaps the write.
+    """
+    def __init__(self):
+        self.que = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.que.get()
+            if item is None:
+                return
+            _id, values = item
+            try:
+                write_mysql(_id, values)
+            except Exception:  # pylint: disable=broad-except
+                logger.error('failed to write %s', _id)
+                traceback.print_exc()
+
+    def submit(self, _id, values):
+        """queue the rows of the paper
+        """
+        self.que.put((_id, values))
+
+    def close(self):
+        """wait for the queued papers to be written
+        """
+        self.que.put(None)
+        self.thread.join()
+
+
+def process(results, _id, var_normalizer, writer=None):  # pylint: disable=too-many-locals
     """normalize HGVS variants to chromosome variants
+
+    Args:
+        writer: `AsyncWriter` to write in the background, otherwise written here
     """
     vcf_dict = dict()
 
     with var_normalizer.connect():
-        for r in results:
-            for tx_name, vcf in var_normalizer.to_vcf([r.gene_id], r.var_json):
-                chrom, position, ref, alt = vcf
-                if len(ref) > 200 or len(alt) > 200:
-                    continue
-                key = IndexKey(
-                    chrom=chrom, position=position, ref=ref, alt=alt,
-                    paper_id=_id, file_idx=r.file_idx,
-                    in_table=r.in_table, table_idx=r.table_idx,
-                    row=r.row, col=r.col, start=r.start,
-                )
-                vcf_dict[key] = (tx_name, r.gene_id, r.end, r.variant, r.gene_start, r.gene_end)
+        vcfs = var_normalizer.to_vcf_batch((r.gene_id, r.var_json) for r in results)
+
+    for r in results:
+        for tx_name, vcf in vcfs[(r.gene_id, r.var_json)]:
+            chrom, position, ref, alt = vcf
+            if len(ref) > 200 or len(alt) > 200:
+                continue
+            key = IndexKey(
+                chrom=chrom, position=position, ref=ref, alt=alt,
+                paper_id=_id, file_idx=r.file_idx,
+                in_table=r.in_table, table_idx=r.table_idx,
+                row=r.row, col=r.col, start=r.start,
+            )
+            vcf_dict[key] = (tx_name, r.gene_id, r.end, r.variant, r.gene_start, r.gene_end)
 
     values = []
     for key, (tx_name, gene_id, end, mention, gene_start, gene_end) in vcf_dict.items():
         values.append({
+            'var_key': variant_key(key.chrom, key.position, key.ref, key.alt),
             'chrom': key.chrom,
             'position': key.position,
             'ref': key.ref,
             'alt': key.alt,
             'gene_id': gene_id,
             'transcript': tx_name,
-            '_id': key.paper_id,
             'file_idx': key.file_idx,
             'in_table': key.in_table,
             'table_idx': key.table_idx,
@@ -86,4 +156,7 @@ def process(results, _id, var_normalizer):  # pylint: disable=too-many-locals
             'gene_start': gene_start,
             'gene_end': gene_end,
         })
-    write_mysql(_id, values)
+    if writer is not None:
+        writer.submit(_id, values)
+    else:
+        write_mysql(_id, values)
@@ -17,9 +17,8 @@ import hashlib
 import base64
 import shutil
 
-import cv2
-
-from .parse import parse_dir, PaperData
+from .parse import parse_dir
+from .table import Table
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -56,22 +55,41 @@ def dump_data(_id, parsed_data):
         for i, table in enumerate(data.tables):
             if 'image' in table:
                 with open(f'{output_dir}/{idx}/table_images/{i}.jpg', 'wb') as fout:
-                    fout.write(table['image'])
+                    fout.write(table['image'].data)
                 del table['image']
 
         with open(f'{output_dir}/{idx}/tables.json', 'w') as fout:
-            fout.write(json.dumps(data.tables))
+            fout.write(json.dumps(data.tables, default=Table.to_json))
+
 
+def body_windows(body, size=100000, context=10000):
+    """split the body on sentence boundaries into windows of about `size` characters
 
-def truncate_data(parsed_data, max_body_len=100000):
-    """truncate if too long (usually not real articles)
+    Returns a list of (start, end, context_start, context_end). The windows
+    [start, end) cover the sentences of the body once, [context_start,
+    context_end) add about `context` characters of sentences on both sides.
+    A sentence longer than `size` is a window by itself.
     """
-    ret = []
-    for idx, filename, data in parsed_data:
-        if len(data.body) > max_body_len:
-            data = PaperData(data.body[:max_body_len], data.tables)
-        ret.append((idx, filename, data))
-    return ret
+    n = len(body)
+    windows, start = [], 0
+    while True:
+        end = n
+        if n - start > size:
+            end = body.rfind('\n', start, start + size + 1)
+            if end <= start:
+                end = body.find('\n', start + size)
+                end = n if end < 0 else end
+
+        context_start = 0
+        if start - context > 0:
+            context_start = body.rfind('\n', 0, start - context) + 1
+        context_end = body.find('\n', end + context) if end + context < n else -1
+        context_end = n if context_end < 0 else context_end
+
+        windows.append((start, end, context_start, context_end))
+        if end >= n:
+            return windows
+        start = end + 1
 
 
 def process(_id, dir_path, nxml_only=False, table_detect=True, save_data=False):
@@ -81,7 +99,6 @@ def process(_id, dir_path, nxml_only=False, table_detect=True, save_data=False):
                             nxml_only=nxml_only,
                             table_detect=table_detect)
     parsed_data = list(parsed_data)
-    parsed_data = truncate_data(parsed_data)
 
     if save_data:
         dump_data(_id, parsed_data)
@@ -0,0 +1,64 @@
+"""compare page rendering by pdftoppm and by fitz
+
+Prints the time per page of both paths and whether the table detector
+finds the same boxes (IoU >= 0.9, in the coordinates of the 150 dpi image).
+Start the detector with TABLE_CACHE_PATH='' to time the inference of both.
+
+Usage:
+    LOAD_BALANCER_HOST=localhost python -m parse_data.compare_render paper.pdf ...
+"""
+import sys
+import time
+
+import fitz
+
+from .pdf_utils import pdf_to_image, render_page, find_tables, find_tables_in_image
+
+
+def iou(box1, box2):
+    w = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    h = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if w <= 0 or h <= 0:
+        return 0.
+    inter = w * h
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    return inter / (area1 + area2 - inter)
+
+
+def same_boxes(boxes1, boxes2, thresh=0.9):
+    return len(boxes1) == len(boxes2) and all(any(iou(b1, b2) >= thresh for b2 in boxes2) for b1 in boxes1)
+
+
+def compare(filename):
+    """return (n_pages, n_same, old secs, new secs) of a pdf
+    """
+    t0 = time.time()
+    _, page_image_data = pdf_to_image(filename)
+    old_boxes = [find_tables(data) for data in page_image_data]
+    t_old = time.time() - t0
+
+    t0 = time.time()
+    new_boxes = [find_tables_in_image(render_page(page)) for page in fitz.open(filename)]
+    t_new = time.time() - t0
+
+    n_same = sum(same_boxes(b1, b2) for b1, b2 in zip(old_boxes, new_boxes))
+    return len(new_boxes), n_same, t_old, t_new
+
+
+def main():
+    total = [0, 0, 0., 0.]
+    for filename in sys.argv[1:]:
+        ret = compare(filename)
+        n_pages, n_same, t_old, t_new = ret
+        print(f'{filename}: {n_same}/{n_pages} pages with the same boxes, '
+              f'pdftoppm {t_old / n_pages * 1000:.1f} ms/page, fitz {t_new / n_pages * 1000:.1f} ms/page')
+        total = [a + b for a, b in zip(total, ret)]
+    n_pages, n_same, t_old, t_new = total
+    if n_pages:
+        print(f'total: {n_same}/{n_pages} pages with the same boxes, '
+              f'pdftoppm {t_old / n_pages * 1000:.1f} ms/page, fitz {t_new / n_pages * 1000:.1f} ms/page')
+
+
+if __name__ == '__main__':
+    main()
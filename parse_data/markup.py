@@ -0,0 +1,79 @@
+"""read nxml, xml, html
+"""
+import logging
+import traceback
+
+from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
+from bs4 import BeautifulSoup
+import lxml  # pylint: disable=unused-import
+
+from .utils import clean_text, timeout
+from .table import Table
+from .parse import PaperData
+
+logger = logging.getLogger(__name__)
+
+
+@timeout(180)
+def read_xml(path):  # pylint: disable=too-many-locals
+    """read nxml, xml, html
+    """
+    try:
+        with open(path, 'rb') as f:
+            s = f.read()
+        s = s.decode('utf8')
+        s = s.replace('<break/>', ', ')
+        soup = BeautifulSoup(s, 'lxml')
+
+        title = soup.find('article-title')
+        title = title.getText(' ') if title is not None else ''
+        title = clean_text(title)
+
+        body = [title]
+        tables = []
+
+        punkt_param = PunktParameters()
+        punkt_param.abbrev_types = set(['fig'])
+        tokenizer = PunktSentenceTokenizer(punkt_param)
+
+        for tb in soup.findAll('table'):
+            rows = ([clean_text(td.getText(' ')) for td in tr.findAll(['td', 'th'])] for tr in tb.findAll(['tr']))
+            table = {'cells': Table.from_rows(rows)}
+
+            parent = tb
+            while parent is not None and parent.find('label') is None:
+                parent = parent.find_parent()
+            if parent is not None:
+                label = parent.find('label').getText(' ')
+                caption_obj = parent.find('caption')
+                if caption_obj is not None:
+                    caption = caption_obj.getText(' ')
+                else:
+                    caption = ''
+            else:
+                label, caption = None, None
+
+            table.update({
+                'caption': {
+                    'text': caption,
+                    'label': label,
+                }
+            })
+            tables.append(table)
+
+        for paragraph in soup.findAll('p'):
+            for t in paragraph.findAll('table'):
+                t.extract()
+            p = map(clean_text, paragraph.getText(' ').split())
+            p = ' '.join(filter(bool, p))
+            body += tokenizer.tokenize(p)
+        body = '\n'.join(body)
+
+        data = PaperData(body, tables)
+
+    except Exception:
+        logger.info('fail: %s', path)
+        traceback.print_exc()
+        return PaperData()
+
+    return data
@@ -0,0 +1,27 @@
+"""read pdf
+"""
+import logging
+import traceback
+
+from .utils import timeout
+from .pdf_utils import get_pdf_objects
+from .parse import PaperData
+
+logger = logging.getLogger(__name__)
+
+
+@timeout(300)
+def read_pdf(path, table_detect=True):
+    """read pdf
+    """
+    try:
+        body, tables = get_pdf_objects(path, table_detect)
+        body = '\n'.join(body)
+        data = PaperData(body, tables)
+
+    except Exception:
+        logger.info('fail: %s', path)
+        traceback.print_exc()
+        return PaperData()
+
+    return data
@@ -1,6 +1,7 @@
 """pdf utils
 """
 import os
+import math
 import itertools
 import subprocess
 import logging
@@ -8,11 +9,11 @@ import logging
 from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
 import numpy as np
 import fitz
-import rpyc
 import cv2
 
-from .utils import clean_text, overlap_ratio, load_np
+from .utils import clean_text, overlap_ratio, load_np, dump_np
 from .table_post_process import table_post_process
+from .table import Table
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,12 +31,17 @@ CHAR_MAP = {
     'Universal-GreekwithMathP': str.maketrans(b'\xef\xbf\xbd'.decode('utf8'), '>'),
 }
 
+DPI = 150
+# cfg.TEST.SCALES and cfg.TEST.MAX_SIZE of the table detector
+DETECTOR_SCALE = 600
+DETECTOR_MAX_SIZE = 1000
+
 
 def pdf_to_image(filename):
     """convert pdf to image
     """
     with open(os.devnull, 'w') as fnull:
-        data = subprocess.check_output(['pdftoppm', '-jpeg', '-r', '150', filename], stderr=fnull)
+        data = subprocess.check_output(['pdftoppm', '-jpeg', '-r', str(DPI), filename], stderr=fnull)
     data = list(map(lambda x: x + b'\xff\xd9', data.split(b'\xff\xd9')[:-1]))
     images = []
     for page_data in data:
@@ -45,6 +51,46 @@ def pdf_to_image(filename):
     return images, data
 
 
+def render_page(page, dpi=DPI, clip=None):
+    """rasterize a page of an open fitz document into a BGR image
+
+    `clip` is a box in the pixels of the rendered page.
+    """
+    zoom = dpi / 72
+    if clip is not None:
+        clip = fitz.Rect(*[z / zoom for z in clip])
+    pix = page.getPixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    image = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, pix.n)
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def encode_table_image(image):
+    """encode the crop of a table as grayscale jpeg
+    """
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), 75])[1].tostring()
+
+
+class TableImage:
+    """jpeg image of a table, rendered from the page when `data` is first read
+
+    Tables whose images are never saved are neither cropped nor encoded.
+    """
+    def __init__(self, doc, page_no, bbox, data=None):
+        # the document, not the page, so that it is not closed before rendering
+        self.doc = doc
+        self.page_no = page_no
+        self.bbox = bbox
+        self._data = data
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = encode_table_image(render_page(self.doc[self.page_no], clip=self.bbox))
+            self.doc = None
+        return self._data
+
+
 def get_lines(block):
     """get text lines from the pdf block
     """
@@ -169,24 +215,21 @@ def find_column_positions(lines):
     """
     rights = []
     n_lines = len(lines)
-    tcs = list(itertools.chain(*lines))
-    tcs.sort(key=lambda x: x.bbox[0])
+    tcs = sorted((r.bbox for r in itertools.chain(*lines)), key=lambda bbox: bbox[0])
+    lefts = [bbox[0] for bbox in tcs]
+    ends = [bbox[2] for bbox in tcs]
+    # number of boxes taken for each column
+    chunk_size = math.ceil(n_lines * 0.8)
 
-    i, cur, cur_tcs = 0, 0, []
+    i = 0
     while i < len(tcs):
-        if cur < n_lines * 0.8:
-            cur_tcs.append(tcs[i])
-            cur += 1
+        chunk = sorted(ends[i:i + chunk_size])
+        rights.append(chunk[len(chunk) // 4 * 3])
+        i += len(chunk)
+        while i > 0 and i < len(tcs) and ends[i] - rights[-1] > rights[-1] - lefts[i]:
+            i -= 1
+        while i < len(tcs) and ends[i] - rights[-1] < rights[-1] - lefts[i]:
             i += 1
-
-        if cur >= n_lines * 0.8 or i == len(tcs):
-            cur_tcs.sort(key=lambda x: x.bbox[2])
-            rights.append(cur_tcs[len(cur_tcs) // 4 * 3].bbox[2])
-            cur, cur_tcs = 0, []
-            while i > 0 and i < len(tcs) and tcs[i].bbox[2] - rights[-1] > rights[-1] - tcs[i].bbox[0]:
-                i -= 1
-            while i < len(tcs) and tcs[i].bbox[2] - rights[-1] < rights[-1] - tcs[i].bbox[0]:
-                i += 1
     return rights
 
 
@@ -201,24 +244,26 @@ def find_row_positions(lines):
     return bottoms
 
 
-def find_cell(bbox, rows, columns):
-    """determine which cell the box belongs to
+def find_cells(bboxes, rows, columns):
+    """determine which cells the boxes belong to, return the row and column indices
+
+    The row is the first one whose bottom is below the bottom of the box,
+    the column is the first one with the max horizontal overlap (0 if none).
     """
-    # choose which the bottom of the bounding box in
-    r = len(rows) - 1
-    for i, x in enumerate(rows):
-        if bbox[3] <= x:
-            r = i
-            break
-
-    # choose max horizontal overlap
-    columns = [0] + columns
-    c, max_overlap = 0, 0
-    for i in range(1, len(columns)):
-        if min(bbox[2], columns[i]) - max(bbox[0], columns[i - 1]) > max_overlap:
-            max_overlap = min(bbox[2], columns[i]) - max(bbox[0], columns[i - 1])
-            c = i - 1
-    return r, c
+    if not bboxes:
+        return [], []
+    bboxes = np.array(bboxes, dtype=np.float64)
+
+    r = np.searchsorted(np.array(rows, dtype=np.float64), bboxes[:, 3], side='left')
+    r = np.minimum(r, len(rows) - 1)
+
+    lefts = np.array([0] + columns[:-1], dtype=np.float64)
+    rights = np.array(columns, dtype=np.float64)
+    overlaps = (np.minimum(bboxes[:, 2, None], rights[None, :]) -
+                np.maximum(bboxes[:, 0, None], lefts[None, :]))
+    c = overlaps.argmax(1)
+    c[overlaps.max(1) <= 0] = 0
+    return r.tolist(), c.tolist()
 
 
 def rotate(bbox, direction):
@@ -237,12 +282,9 @@ def aggregate_cell(dicts):
 
     dicts = sorted(dicts, key=lambda x: x['orig_bbox'][0])
 
-    r = Rectangle(dicts[0]['orig_bbox'], '')
-    for d in dicts:
-        r.union(Rectangle(d['orig_bbox'], d['text']))
-
-    text = clean_text(r.text)
-    bbox = r.bbox
+    text = clean_text(' '.join(d['text'] for d in dicts))
+    x1s, y1s, x2s, y2s = zip(*(d['orig_bbox'] for d in dicts))
+    bbox = (min(x1s), min(y1s), max(x2s), max(y2s))
     return text, bbox
 
 
@@ -259,21 +301,19 @@ def construct_table(blocks):
     n_cols = len(columns)
 
     table_cells = [[[] for col in columns] for row in rows]
-    for text_dict in text_dicts:
-        r, c = find_cell(text_dict['bbox'], rows, columns)
+    cell_rows, cell_cols = find_cells([text_dict['bbox'] for text_dict in text_dicts], rows, columns)
+    for text_dict, r, c in zip(text_dicts, cell_rows, cell_cols):
         table_cells[r][c].append(text_dict)
 
-    table = []
+    texts, bboxes = [], []
     for r in range(n_rows):
         row = []
         for c in range(n_cols):
             text, bbox = aggregate_cell(table_cells[r][c])
-            row.append({
-                'text': text,
-                'bbox': bbox,
-            })
-        table.append(row)
-    return table
+            row.append(text)
+            bboxes.append(bbox)
+        texts.append(row)
+    return Table.from_rows(texts, bboxes)
 
 
 def get_pdf_page_dict(page, ratio):
@@ -309,21 +349,31 @@ def split_sents(body, max_sent_len=2000):
     return ret
 
 
-def get_pdf_objects(filename, table_detect=True):  # pylint: disable=too-many-locals
+def get_pdf_objects(filename, table_detect=True, render='fitz'):  # pylint: disable=too-many-locals
     """extract body, table, table images from pdf
+
+    Pages are rendered by the open fitz document, or with `render='pdftoppm'`
+    by pdftoppm and sent to the table detector as jpeg.
     """
     body, tables = [], []
 
     pages = fitz.open(filename)
-    page_images, page_image_data = pdf_to_image(filename)
+    if render == 'pdftoppm':
+        page_images, page_image_data = pdf_to_image(filename)
 
     prev_caption = None
     for i, page in enumerate(pages):
-        ratio = page_images[i].shape[0] / page.rect[3]
+        page_image = page_images[i] if render == 'pdftoppm' else render_page(page)
+        ratio = page_image.shape[0] / page.rect[3]
 
         page_dict = get_pdf_page_dict(page, ratio)
 
-        pred_table_boxes = find_tables(page_image_data[i]) if table_detect else []
+        if not table_detect:
+            pred_table_boxes = []
+        elif render == 'pdftoppm':
+            pred_table_boxes = find_tables(page_image_data[i])
+        else:
+            pred_table_boxes = find_tables_in_image(page_image)
         page_tables = table_post_process(page_dict, pred_table_boxes, prev_caption)
         prev_caption = page_tables[-1]['caption'] if page_tables else None
 
@@ -347,15 +397,16 @@ def get_pdf_objects(filename, table_detect=True):  # pylint: disable=too-many-lo
         for j, (blocks, table) in enumerate(zip(table_blocks, page_tables)):
             table['cells'] = construct_table(blocks)
 
-        # crop table images
+        # table images, rendered again from the page if they are used
         for table in page_tables:
             x1, y1, x2, y2 = table['bbox']
-            image = page_images[i][y1:y2, x1:x2, :]
+            image = page_image[y1:y2, x1:x2, :]
             if image.size == 0:
                 continue
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            img_data = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), 75])[1].tostring()
-            table['image'] = img_data
+            if render == 'pdftoppm':
+                table['image'] = TableImage(None, i, table['bbox'], encode_table_image(image))
+            else:
+                table['image'] = TableImage(pages, i, table['bbox'])
 
         tables += page_tables
 
@@ -369,13 +420,34 @@ def get_pdf_objects(filename, table_detect=True):  # pylint: disable=too-many-lo
     return body, tables
 
 
-def find_tables(img_data):
-    """get table predictions
+def _detect(method, payload):
+    """call `method` of the table detector with `payload` and return the predicted boxes
     """
+    import rpyc
+
     config = {'allow_all_attrs': True, 'sync_request_timeout': None}
     host = os.environ['LOAD_BALANCER_HOST']
 
     with rpyc.connect(host=host, port=18861, config=config) as conn:
-        ret = conn.root.detect(img_data)
+        ret = getattr(conn.root, method)(payload)
         tables = load_np(ret)
     return tables
+
+
+def find_tables(img_data):
+    """get table predictions
+    """
+    return _detect('detect', img_data)
+
+
+def find_tables_in_image(image):
+    """get table predictions of a BGR page image
+
+    The image is resized to the input size of the detector and sent as an
+    array, so the detector neither decodes nor resizes it again.
+    """
+    height, width = image.shape[:2]
+    scale = min(DETECTOR_SCALE / min(height, width), DETECTOR_MAX_SIZE / max(height, width))
+    resized = cv2.resize(image, None, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    tables = _detect('detect_array', dump_np(resized))
+    return [box / scale for box in tables]
@@ -0,0 +1,88 @@
+"""read spreadsheets
+"""
+import os
+import csv
+import logging
+import traceback
+
+import openpyxl
+import xlrd
+
+from .utils import clean_text, timeout
+from .table import Table
+from .parse import PaperData
+
+logger = logging.getLogger(__name__)
+
+# limits of a spreadsheet supplement, rows per sheet and cells per file
+MAX_TABLE_ROWS = 200000
+MAX_TABLE_CELLS = 5000000
+
+
+def iter_sheets(path):
+    """yield (sheet name, rows) of a csv, tsv, xls or xlsx file
+
+    Rows are read lazily as sequences of cell values, the rows of a sheet
+    must be consumed before the next sheet.
+    """
+    ext = path.rsplit('.', 1)[-1].lower()
+    if ext in ['csv', 'tsv']:
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+            yield os.path.basename(path), csv.reader(f, delimiter='\t' if ext == 'tsv' else ',')
+
+    elif ext == 'xlsx':
+        book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for sheet in book.worksheets:
+                yield sheet.title, sheet.iter_rows(values_only=True)
+        finally:
+            book.close()
+
+    else:
+        book = xlrd.open_workbook(path, on_demand=True)
+        try:
+            for name in book.sheet_names():
+                sheet = book.sheet_by_name(name)
+                yield name, (sheet.row_values(i) for i in range(sheet.nrows))
+                book.unload_sheet(name)
+        finally:
+            book.release_resources()
+
+
+@timeout(180)
+def read_excel(path, max_rows=MAX_TABLE_ROWS, max_cells=MAX_TABLE_CELLS):
+    """read csv, tsv, xls, xlsx
+
+    Non-text cells are empty, trailing empty cells of a row are dropped, so
+    rows may have different lengths. Sheets are cut at `max_rows` rows and
+    the file at `max_cells` cells.
+    """
+    n_cells = 0
+
+    def clean_rows(name, rows):
+        nonlocal n_cells
+        for i, row in enumerate(rows):
+            if i >= max_rows or n_cells >= max_cells:
+                logger.info('%s: sheet %s truncated at %d rows', path, name, i)
+                break
+            texts = [clean_text(col) if isinstance(col, str) and col else '' for col in row]
+            while texts and not texts[-1]:
+                texts.pop()
+            n_cells += len(texts)
+            yield texts
+
+    try:
+        tables = []
+        for name, rows in iter_sheets(path):
+            tables.append({'cells': Table.from_rows(clean_rows(name, rows))})
+            if n_cells >= max_cells:
+                break
+        body = ''
+
+        data = PaperData(body, tables)
+    except Exception:
+        logger.info('fail: %s', path)
+        traceback.print_exc()
+        return PaperData()
+
+    return data
@@ -0,0 +1,103 @@
+"""compact table of cell texts
+"""
+from array import array
+from itertools import islice
+
+import numpy as np
+
+
+class Table:
+    """cell texts of a table in one string, rows may have different lengths
+
+    The text of cell k is `text[offsets[k]:offsets[k + 1]]`, and the cells of
+    row i are `row_offsets[i]` to `row_offsets[i + 1]`. `bboxes` is an
+    (n_cells, 4) array of the cell boxes of pdf tables, None otherwise.
+    """
+    __slots__ = ('text', 'offsets', 'row_offsets', 'bboxes')
+
+    def __init__(self, text='', offsets=None, row_offsets=None, bboxes=None):
+        self.text = text
+        self.offsets = offsets if offsets is not None else array('I', [0])
+        self.row_offsets = row_offsets if row_offsets is not None else array('I', [0])
+        self.bboxes = bboxes
+
+    @classmethod
+    def from_rows(cls, rows, bboxes=None):
+        """build from an iterable of rows of cell texts, and the cell boxes in the same order
+        """
+        parts, offsets, row_offsets = [], array('I', [0]), array('I', [0])
+        for row in rows:
+            for text in row:
+                parts.append(text)
+                offsets.append(offsets[-1] + len(text))
+            row_offsets.append(len(parts))
+        if bboxes is not None:
+            bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        return cls(''.join(parts), offsets, row_offsets, bboxes)
+
+    def __len__(self):
+        return len(self.row_offsets) - 1
+
+    @property
+    def n_cells(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_cols(self):
+        """length of the longest row
+        """
+        return max((b - a for a, b in zip(self.row_offsets, self.row_offsets[1:])), default=0)
+
+    def _text(self, k):
+        return self.text[self.offsets[k]:self.offsets[k + 1]]
+
+    def cell(self, i, j):
+        """return the text of cell (i, j), '' if the row is shorter
+        """
+        k = self.row_offsets[i] + j
+        if j < 0 or k >= self.row_offsets[i + 1]:
+            return ''
+        return self._text(k)
+
+    def cell_bbox(self, i, j):
+        """return the box of cell (i, j), or None
+        """
+        k = self.row_offsets[i] + j
+        if self.bboxes is None or j < 0 or k >= self.row_offsets[i + 1]:
+            return None
+        return tuple(self.bboxes[k].tolist())
+
+    def row(self, i):
+        """return the cell texts of row i
+        """
+        return [self._text(k) for k in range(self.row_offsets[i], self.row_offsets[i + 1])]
+
+    def rows(self):
+        """iterate the rows as lists of cell texts
+        """
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def iter_cells(self):
+        """iterate (row, col, text) of all cells
+        """
+        text, row_offsets = self.text, self.row_offsets
+        bounds = zip(self.offsets, islice(self.offsets, 1, None))
+        for i, (start, end) in enumerate(zip(row_offsets, islice(row_offsets, 1, None))):
+            # zip takes from range first, so bounds stops at the end of the row
+            for j, (a, b) in zip(range(end - start), bounds):
+                yield i, j, text[a:b]
+
+    def to_json(self):
+        """return the cells as rows of {'text': ..., 'bbox': ...}, the format of tables.json
+        """
+        ret = []
+        for i in range(len(self)):
+            row = []
+            for j, text in enumerate(self.row(i)):
+                cell = {'text': text}
+                if self.bboxes is not None:
+                    cell['bbox'] = self.cell_bbox(i, j)
+                row.append(cell)
+            ret.append(row)
+        return ret
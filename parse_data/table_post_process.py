@@ -3,11 +3,9 @@ import random
 import itertools
 import functools
 import pprint
-from collections import Counter
+from collections import Counter, defaultdict
 
 from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
-import fitz
-import cv2
 
 from .utils import overlap_ratio, clean_text
 
@@ -117,20 +115,59 @@ def merge_boxes(box1, box2):
             max(box1[2], box2[2]), max(box1[3], box2[3]))
 
 
+def candidate_pairs(boxes, extend, cell_size=64):
+    """return index pairs (i, j), i < j, of boxes which may overlap once grown by `extend`
+
+    Each box is put in the cells of a uniform grid it covers, only boxes
+    sharing a cell are paired.
+    """
+    grid = defaultdict(list)
+    for i, box in enumerate(boxes):
+        x1, x2 = min(box[0], box[2]), max(box[0], box[2]) + extend
+        y1, y2 = min(box[1], box[3]), max(box[1], box[3]) + extend
+        for cx in range(int(x1 // cell_size), int(x2 // cell_size) + 1):
+            for cy in range(int(y1 // cell_size), int(y2 // cell_size) + 1):
+                grid[cx, cy].append(i)
+
+    pairs = set()
+    for members in grid.values():
+        pairs.update(itertools.combinations(members, 2))
+    return pairs
+
+
+def connected_groups(boxes, extend, connected):
+    """group the indices of boxes connected by `connected(i, j)`, directly or through others
+
+    Groups are ordered by their first index, the indices of a group are ascending.
+    """
+    parents = list(range(len(boxes)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in candidate_pairs(boxes, extend):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j and connected(i, j):
+            parents[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = defaultdict(list)
+    for i in range(len(boxes)):
+        groups[find(i)].append(i)
+    return [groups[root] for root in sorted(groups)]
+
+
 def merge_tables(table_boxes):
     """merge tables if they overlap
     """
-    classes = [i for i in range(len(table_boxes))]
-    for i, table_box in enumerate(table_boxes):
-        for j, table_box2 in enumerate(table_boxes):
-            r = overlap_ratio(table_box, table_box2, extend=20)
-            if r >= 0.01:
-                classes = [classes[i] if k == classes[j] else k for k in classes]
+    def _overlap(i, j):
+        return overlap_ratio(table_boxes[i], table_boxes[j], extend=20) >= 0.01
 
     ret = []
-    for cls in set(classes):
-        table_boxes_cls = [table_boxes[i] for i, c in enumerate(classes) if c == cls]
-        box = functools.reduce(merge_boxes, table_boxes_cls)
+    for group in connected_groups(table_boxes, 20, _overlap):
+        box = functools.reduce(merge_boxes, [table_boxes[i] for i in group])
         ret.append(box)
     return ret
 
@@ -145,19 +182,13 @@ def merge_lines(lines):
             'bbox': merge_boxes(l1['bbox'], l2['bbox']),
         }
 
-    groups = [i for i in range(len(lines))]
-    for i, line1 in enumerate(lines):
-        for j, line2 in enumerate(lines):
-            if groups[i] == groups[j]:
-                continue
-            if (line1['dir'] == line2['dir'] and
-                    overlap_ratio(line1['bbox'], line2['bbox'], extend=5)):
-                groups = [groups[i] if g == groups[j] else g for g in groups]
+    def _overlap(i, j):
+        return (lines[i]['dir'] == lines[j]['dir'] and
+                overlap_ratio(lines[i]['bbox'], lines[j]['bbox'], extend=5))
 
     ret = []
-    for cls in set(groups):
-        group_cls = [lines[i] for i, c in enumerate(groups) if c == cls]
-        line = functools.reduce(_merge, group_cls)
+    for group in connected_groups([line['bbox'] for line in lines], 5, _overlap):
+        line = functools.reduce(_merge, [lines[i] for i in group])
         ret.append(line)
     return ret
 
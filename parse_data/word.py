@@ -0,0 +1,60 @@
+"""read word documents
+"""
+import os
+import logging
+import tempfile
+import subprocess
+import traceback
+
+from nltk.tokenize.punkt import PunktSentenceTokenizer, PunktParameters
+import docx
+
+from .utils import clean_text, timeout
+from .table import Table
+from .parse import PaperData
+
+logger = logging.getLogger(__name__)
+
+
+@timeout(180)
+def read_doc(path):
+    """read .doc
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        with open(os.devnull, 'w') as fnull:
+            subprocess.call(['soffice', '--headless', '--convert-to', 'docx',
+                             '--outdir', tempdir, path], stdout=fnull, stderr=fnull)
+        docx_path = os.path.join(tempdir, os.path.basename(path).rsplit('.', 1)[0] + '.docx')
+        ret = read_docx(docx_path)
+        os.unlink(docx_path)
+    return ret
+
+
+@timeout(180)
+def read_docx(path):
+    """read .docx (Microsoft 2007+)
+    """
+    try:
+        doc = docx.Document(path)
+
+        punkt_param = PunktParameters()
+        punkt_param.abbrev_types = set(['fig'])
+        tokenizer = PunktSentenceTokenizer(punkt_param)
+
+        body = []
+        for p in doc.paragraphs:
+            body += tokenizer.tokenize(clean_text(p.text))
+        body = '\n'.join(body)
+
+        tables = []
+        for t in doc.tables:
+            rows = ([clean_text(p.text) for cell in row.cells for p in cell.paragraphs] for row in t.rows)
+            tables.append({'cells': Table.from_rows(rows)})
+
+        data = PaperData(body, tables)
+    except Exception:
+        logger.info('fail: %s', path)
+        traceback.print_exc()
+        return PaperData()
+
+    return data
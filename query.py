@@ -1,15 +1,26 @@
+"""query papers of variants, interactively or in batch
+
+Usage:
+    python query.py [OUTPUT_FILE]
+    python query.py --batch INPUT.tsv|INPUT.jsonl [--output OUTPUT.jsonl]
+    python query.py --region chr17:41.19-41.28Mb|BRCA1 [--limit N] [--after CURSOR]
+    python query.py --paper PAPER_ID
+"""
 import sys
 import re
 import json
+import time
+import argparse
 import itertools
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict
 
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import and_, or_, select, func
 
 from var_utils import VarNormalizer
 sys.path.insert(0, '/app/mysqldb')
 from models import (engine,  # pylint: disable=no-name-in-module, wrong-import-position
-                    gene, var_pmid, VarPmid)
+                    gene, paper, transcript, var_pmid, VarPmid, variant_key)
 
 ALL_TO_ONE = {
 #{{{
@@ -95,81 +106,421 @@ def error(msg):
     print(msg)
     exit(0)
 
-fout = sys.stdout
-if len(sys.argv) > 1:
-    fout = open(sys.argv[1], 'w')
 
-gene_name = input('Gene: ')
-variant_name = input('Variant: ')
-print()
+def parse_variant(variant_name):
+    """return the variant json dict of the variant name, or None if not supported
+    """
+    for mutation_type, rs, pattern in patterns:
+        m = re.match(pattern, variant_name)
+        if m:
+            d = m.groupdict()
+            break
+    else:
+        return None
+
+    d['mut_type'] = mutation_type
+    if 'rsid' not in d:
+        if not d.get('end', None):
+            d['end'] = d['start']
+
+        if 'seq' in d and d['seq']:
+            seq = d['seq']
+        else:
+            seq = rs
+        del d['seq']
+        d['seq_types'] = [seq]
+    return d
+
+
+def get_gene_ids(conn, gene_names, chunk_size=1000):
+    """return a dict of gene name -> gene id of the given names, in one query per chunk
+
+    Names are gene ids or symbols. Symbols match case-insensitively, as
+    `gene.c.symbol == name` does under the mysql collation, and are keyed
+    as given.
+    """
+    ret = dict()
+    names = defaultdict(set)
+    for name in gene_names:
+        if name.isdigit():
+            ret[name] = int(name)
+        else:
+            names[name.lower()].add(name)
+
+    symbols = sorted(names)
+    for i in range(0, len(symbols), chunk_size):
+        query = select([gene.c.symbol, gene.c.id]).where(gene.c.symbol.in_(symbols[i:i + chunk_size]))
+        for symbol, gene_id in conn.execute(query):
+            for name in names.get(symbol.lower(), ()):
+                ret.setdefault(name, gene_id)
+    return ret
+
+
+def search_vcfs(conn, vcfs, chunk_size=500):
+    """return a dict of (chrom, position, ref, alt) -> list of `VarPmid`,
+    in one query per chunk of variants
+    """
+    vcfs = sorted(set(vcfs))
+    ret = {vcf: [] for vcf in vcfs}
+    for i in range(0, len(vcfs), chunk_size):
+        keys = [variant_key(*vcf) for vcf in vcfs[i:i + chunk_size]]
+        query = select([var_pmid, paper.c._id]).select_from(
+            var_pmid.join(paper, var_pmid.c.paper_id == paper.c.id)).where(var_pmid.c.var_key.in_(keys))
+        for r in itertools.starmap(VarPmid, conn.execute(query)):
+            vcf = (r.chrom, r.position, r.ref, r.alt)
+            if vcf in ret:
+                ret[vcf].append(r)
+    return ret
+
+
+def group_papers(results):
+    """return a dict of paper id -> {mention location: mention}
+    """
+    d = defaultdict(dict)
+    for r in results:
+        d[r.pmid][(r.file_idx, r.table_idx, r.row, r.col, r.start)] = r.mention
+    return d
+
+
+REGION_PATTERN = re.compile(r'^(?P<chrom>[^:]+):(?P<start>[\d.,]+)(?P<start_unit>[kKmM][bB])?'
+                            r'-(?P<end>[\d.,]+)(?P<end_unit>[kKmM][bB])?$')
+UNITS = {None: 1, 'kb': 1000, 'mb': 1000000}
+
+
+def parse_region(region):
+    """parse `chr17:41190000-41280000` or `chr17:41.19-41.28Mb` to (chrom, start, end), 1-based inclusive
+    """
+    m = REGION_PATTERN.match(region.replace(' ', ''))
+    if not m:
+        return None
+    end_unit = UNITS[m.group('end_unit') and m.group('end_unit').lower()]
+    start_unit = UNITS[m.group('start_unit').lower()] if m.group('start_unit') else end_unit
+    start = int(round(float(m.group('start').replace(',', '')) * start_unit))
+    end = int(round(float(m.group('end').replace(',', '')) * end_unit))
+    chrom = m.group('chrom')
+    if not chrom.startswith('chr'):
+        chrom = f'chr{chrom}'
+    return chrom, start, end
+
+
+def get_gene_regions(conn, gene_id):
+    """return the spans of the transcripts of the gene, one (chrom, start, end) per chromosome
+    """
+    query = (select([transcript.c.chrom, func.min(transcript.c.tx_start), func.max(transcript.c.tx_end)])
+             .where(transcript.c.gene_id == gene_id).group_by(transcript.c.chrom))
+    # tx_start is 0-based, vcf positions are 1-based
+    return sorted((chrom, tx_start + 1, tx_end) for chrom, tx_start, tx_end in conn.execute(query))
+
+
+def search_regions(conn, regions, limit=100, after=None):
+    """return the mentions of variants in the regions ordered by position
+
+    Args:
+        regions: list of (chrom, start, end)
+        after: cursor returned with the previous page, `region index:position:var_pmid row id`
+
+    Returns:
+        list of `VarPmid`, and the cursor of the next page or None
+    """
+    region_idx, after_pos, after_row_id = map(int, after.split(':')) if after else (0, 0, 0)
+    results = []
+    for i in range(region_idx, len(regions)):
+        chrom, start, end = regions[i]
+        cond = [var_pmid.c.chrom == chrom, var_pmid.c.position.between(start, end)]
+        if i == region_idx and after:
+            cond.append(or_(var_pmid.c.position > after_pos,
+                            and_(var_pmid.c.position == after_pos, var_pmid.c.id > after_row_id)))
+        query = (select([var_pmid, paper.c._id])
+                 .select_from(var_pmid.join(paper, var_pmid.c.paper_id == paper.c.id))
+                 .where(and_(*cond))
+                 .order_by(var_pmid.c.position, var_pmid.c.id)
+                 .limit(limit - len(results)))
+        results += itertools.starmap(VarPmid, conn.execute(query))
+        if len(results) >= limit:
+            last = results[-1]
+            return results, f'{i}:{last.position}:{last.row_id}'
+    return results, None
+
+
+def mention_result(r):
+    """return the dict of a mention found by `search_regions`
+    """
+    return {
+        'chrom': r.chrom, 'position': r.position, 'ref': r.ref, 'alt': r.alt,
+        'gene_id': r.gene_id, 'transcript': r.transcript, 'pmid': r.pmid, 'mention': r.mention,
+        'file_idx': r.file_idx, 'in_table': bool(r.in_table), 'table_idx': r.table_idx,
+        'row': r.row, 'col': r.col, 'start': r.start, 'end': r.end,
+    }
+
+
+def query_region(region, limit=100, after=None, db=engine, gene_ids=None):
+    """return a page of mentions in a region or a gene given as a symbol or id
+
+    Args:
+        gene_ids: dict of lower-cased gene symbol -> gene id, otherwise looked up in `db`
+    """
+    with db.connect() as conn:
+        regions = parse_region(region)
+        if regions is not None:
+            regions = [regions]
+        else:
+            if gene_ids is None or region.isdigit():
+                gene_id = get_gene_ids(conn, [region]).get(region)
+            else:
+                gene_id = gene_ids.get(region.lower())
+            if not gene_id:
+                return {'region': region, 'error': 'cannot recognize the region or gene symbol'}
+            regions = get_gene_regions(conn, gene_id)
+        results, cursor = search_regions(conn, regions, limit, after)
+
+    return {
+        'region': region,
+        'regions': [{'chrom': chrom, 'start': start, 'end': end} for chrom, start, end in regions],
+        'mentions': [mention_result(r) for r in results],
+        'next': cursor,
+    }
+
+
+def get_paper_version(conn, pmid):
+    """return (id, version) of the paper, or None if not indexed
+    """
+    return conn.execute(select([paper.c.id, paper.c.version]).where(paper.c._id == pmid)).fetchone()
+
+
+def get_index_version(conn):
+    """return (count, max id, sum of versions) of the paper table, changed whenever a paper is written
+    """
+    query = select([func.count(), func.max(paper.c.id), func.sum(paper.c.version)]).select_from(paper)
+    return tuple(conn.execute(query).fetchone())
+
+
+def search_paper(conn, paper_id):
+    """return the mentions of the paper and the symbols of their genes
+    """
+    query = (select([var_pmid, gene.c.symbol])
+             .select_from(var_pmid.outerjoin(gene, var_pmid.c.gene_id == gene.c.id))
+             .where(var_pmid.c.paper_id == paper_id)
+             .order_by(var_pmid.c.gene_id, var_pmid.c.position, var_pmid.c.ref, var_pmid.c.alt,
+                       var_pmid.c.file_idx, var_pmid.c.in_table, var_pmid.c.table_idx,
+                       var_pmid.c.row, var_pmid.c.col, var_pmid.c.start))
+    for row in conn.execute(query):
+        yield VarPmid(*row[:-1]), row[-1]
+
+
+def group_paper_variants(pmid, rows):
+    """group the mentions of a paper by gene, variant and location
+    """
+    genes = OrderedDict()
+    for r, symbol in rows:
+        g = genes.setdefault(r.gene_id, {'gene_id': r.gene_id, 'symbol': symbol, 'variants': OrderedDict()})
+        v = g['variants'].setdefault((r.chrom, r.position, r.ref, r.alt), {
+            'chrom': r.chrom, 'position': r.position, 'ref': r.ref, 'alt': r.alt,
+            'transcripts': [], 'body': [], 'table': [],
+        })
+        if r.transcript not in v['transcripts']:
+            v['transcripts'].append(r.transcript)
+        location = {'mention': r.mention, 'file_idx': r.file_idx, 'start': r.start, 'end': r.end}
+        if r.in_table:
+            location.update({'table_idx': r.table_idx, 'row': r.row, 'col': r.col})
+            v['table'].append(location)
+        else:
+            v['body'].append(location)
+
+    for g in genes.values():
+        g['variants'] = list(g['variants'].values())
+    return {'pmid': pmid, 'genes': list(genes.values())}
+
+
+class PaperCache:
+    """LRU of paper results, valid while the version of the paper is unchanged
 
-if gene_name.isdigit():
-    gene_id = int(gene_name)
+    `normalize_var.write_mysql` increases the version whenever it rewrites a paper.
+    """
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
 
-else:
+    def get(self, pmid, version):
+        with self.lock:
+            item = self.cache.get(pmid)
+            if item is None or item[0] != version:
+                return None
+            self.cache.move_to_end(pmid)
+            return item[1]
+
+    def put(self, pmid, version, result):
+        with self.lock:
+            self.cache[pmid] = (version, result)
+            self.cache.move_to_end(pmid)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+
+def query_paper(pmid, db=engine, cache=None):
+    """return the variants mentioned in a paper grouped by gene and location
+    """
+    with db.connect() as conn:
+        row = get_paper_version(conn, pmid)
+        if row is None:
+            return {'pmid': pmid, 'error': 'paper not found'}
+        paper_id, version = row
+        if cache is not None:
+            ret = cache.get(pmid, version)
+            if ret is not None:
+                return ret
+        ret = group_paper_variants(pmid, search_paper(conn, paper_id))
+
+    if cache is not None:
+        cache.put(pmid, version, ret)
+    return ret
+
+
+def query_interactive(fout):
+    """query one variant read from stdin
+    """
+    gene_name = input('Gene: ')
+    variant_name = input('Variant: ')
+    print()
+
+    with engine.connect() as conn:
+        gene_id = get_gene_ids(conn, [gene_name]).get(gene_name)
+    if not gene_id:
+        error('gene symbol not found')
+
+    print('GeneID:', gene_id, file=fout)
+
+    d = parse_variant(variant_name)
+    if d is None:
+        error('cannot reconigze the variant or variant type not supported')
+
+    print('VariantJson:', json.dumps(d), file=fout)
+    print(file=fout)
+
+    var_normalizer = VarNormalizer()
+    with var_normalizer.connect():
+        vcfs = [vcf for _, vcf in var_normalizer.to_vcf([gene_id], json.dumps(d))]
+
+    with engine.connect() as conn:
+        papers = search_vcfs(conn, vcfs)
+    results = [r for vcf in vcfs for r in papers[vcf]]
+
+    d = group_papers(results)
+
+    print(f'{len(d)} results found:', file=fout)
+    for pmid, pmid_dict in d.items():
+        print('pmid:', pmid, file=fout)
+        for mention in pmid_dict.values():
+            print('\tvariant:', mention, file=fout)
+
+
+def read_pairs(fin):
+    """yield (gene, variant) from TSV lines or JSONL lines with "gene" and "variant"
+    """
+    for line in fin:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            d = json.loads(line)
+            yield str(d['gene']), d['variant']
+        else:
+            gene_name, variant_name = line.split('\t')[:2]
+            yield gene_name.strip(), variant_name.strip()
+
+
+def make_result(gene_name, variant_name, gene_id, var_json, tx_vcfs, papers):  # pylint: disable=too-many-arguments
+    """return the result dict of a (gene, variant) query
+
+    Args:
+        tx_vcfs: list of (transcript, vcf) of the variant
+        papers: dict of vcf -> list of `VarPmid`, see `search_vcfs`
+    """
+    ret = {'gene': gene_name, 'variant': variant_name}
+    if not gene_id:
+        ret['error'] = 'gene symbol not found'
+    elif var_json is None:
+        ret['error'] = 'cannot reconigze the variant or variant type not supported'
+    else:
+        ret['gene_id'] = gene_id
+        ret['variant_json'] = json.loads(var_json)
+        ret['vcfs'] = sorted({vcf for _, vcf in tx_vcfs})
+        d = group_papers(r for _, vcf in tx_vcfs for r in papers[vcf])
+        ret['papers'] = [{'pmid': pmid, 'mentions': list(pmid_dict.values())}
+                         for pmid, pmid_dict in d.items()]
+    return ret
+
+
+def query_chunk(pairs, var_normalizer):
+    """yield one result dict for each (gene, variant) pair
+    """
     with engine.connect() as conn:
-        query = gene.select().where(gene.c.symbol == gene_name)
-        rows = conn.execute(query)
-        row = next(rows, None)
-        if not row:
-            error('gene symbol not found')
-    gene_id = row[0]
-
-print('GeneID:', gene_id, file=fout)
-
-
-for j, (mutation_type, rs, pattern) in enumerate(patterns):
-    m = re.match(pattern, variant_name)
-    if m:
-        d = m.groupdict()
-        break
-else:
-    error('cannot reconigze the variant or variant type not supported')
-
-d['mut_type'] = mutation_type
-if 'rsid' not in d:
-    if not d.get('end', None):
-        d['end'] = d['start']
-
-    if 'seq' in d and d['seq']:
-        seq = d['seq']
+        gene_ids = get_gene_ids(conn, {gene_name for gene_name, _ in pairs})
+
+    var_jsons = dict()
+    for gene_name, variant_name in pairs:
+        d = parse_variant(variant_name)
+        if d is not None and gene_ids.get(gene_name):
+            var_jsons[(gene_name, variant_name)] = json.dumps(d)
+
+    with var_normalizer.connect():
+        vcfs = var_normalizer.to_vcf_batch((gene_ids[gene_name], var_json)
+                                           for (gene_name, _), var_json in var_jsons.items())
+
+    with engine.connect() as conn:
+        papers = search_vcfs(conn, (vcf for tx_vcfs in vcfs.values() for _, vcf in tx_vcfs))
+
+    for gene_name, variant_name in pairs:
+        gene_id = gene_ids.get(gene_name)
+        var_json = var_jsons.get((gene_name, variant_name))
+        tx_vcfs = vcfs.get((gene_id, var_json), [])
+        yield make_result(gene_name, variant_name, gene_id, var_json, tx_vcfs, papers)
+
+
+def query_batch(fin, fout, chunk_size=1000):
+    """query (gene, variant) pairs of the input and write JSONL results
+    """
+    var_normalizer = VarNormalizer()
+    t0, n = time.time(), 0
+    pairs = read_pairs(fin)
+    while True:
+        chunk = list(itertools.islice(pairs, chunk_size))
+        if not chunk:
+            break
+        for ret in query_chunk(chunk, var_normalizer):
+            print(json.dumps(ret), file=fout)
+        fout.flush()
+        n += len(chunk)
+        print(f'{n} variants, {n / (time.time() - t0):.1f} variants/sec', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_file', nargs='?', default=None)
+    parser.add_argument('--batch', type=str, default=None, help='TSV or JSONL of gene and variant')
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--region', type=str, default=None, help='chrom:start-end or gene')
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--after', type=str, default=None, help='cursor of the next page')
+    parser.add_argument('--paper', type=str, default=None, help='paper id, list its variants')
+    args = parser.parse_args()
+
+    output_file = args.output or args.output_file
+    fout = open(output_file, 'w') if output_file else sys.stdout
+
+    if args.batch:
+        with open(args.batch) as fin:
+            query_batch(fin, fout)
+    elif args.paper:
+        print(json.dumps(query_paper(args.paper)), file=fout)
+    elif args.region:
+        print(json.dumps(query_region(args.region, args.limit, args.after)), file=fout)
     else:
-        seq = rs
-    del d['seq']
-    d['seq_types'] = [seq]
-
-print('VariantJson:', json.dumps(d), file=fout)
-print(file=fout)
-
-
-var_normalizer = VarNormalizer()
-vcfs = []
-with var_normalizer.connect():
-    for tx, vcf in var_normalizer.to_vcf([gene_id], json.dumps(d)):
-        vcfs.append((tx, vcf))
-
-results = []
-with engine.connect() as conn:
-    for tx, (chrom, pos, ref, alt) in vcfs:
-        cond = and_(
-            var_pmid.c.chrom == chrom,
-            var_pmid.c.position == pos,
-            var_pmid.c.ref == ref,
-            var_pmid.c.alt == alt,
-        )
-        query = var_pmid.select().where(cond)
-        rows = conn.execute(query)
-        results += list(itertools.starmap(VarPmid, rows))
-
-d = defaultdict(dict)
-for r in results:
-    d[r.pmid][(r.file_idx, r.table_idx, r.row, r.col, r.start)] = r.mention
-
-print(f'{len(d)} results found:', file=fout)
-for pmid, pmid_dict in d.items():
-    print('pmid:', pmid, file=fout)
-    for mention in pmid_dict.values():
-        print('\tvariant:', mention, file=fout)
-
-if len(sys.argv) > 1:
-    fout.close()
+        query_interactive(fout)
+
+    if output_file:
+        fout.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""HTTP/JSON server answering variant queries with warm caches
+
+Usage:
+    python query_server.py [--host 127.0.0.1] [--port 8080]
+
+    GET  /query?gene=GJB2&variant=c.35delG   one result of `query.py --batch`
+    POST /query  [{"gene": ..., "variant": ...}, ...]   list of results
+    GET  /region?region=chr17:41.19-41.28Mb&limit=100&after=CURSOR   mentions ordered by position
+    GET  /paper?id=PAPER_ID   variants of a paper grouped by gene and location
+    GET  /stats   request latency percentiles and cache hit rate
+"""
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from collections import OrderedDict, deque
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from sqlalchemy import create_engine
+from sqlalchemy.sql import select
+
+from var_utils import VarNormalizer
+import query
+sys.path.insert(0, '/app/mysqldb')
+from models import engine, gene  # pylint: disable=no-name-in-module, wrong-import-position
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """latencies of the recent requests
+    """
+    def __init__(self, maxlen=10000):
+        self.latencies = deque(maxlen=maxlen)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def percentiles(self, ps=(50, 90, 99)):
+        """return a dict of percentile -> latency in milliseconds
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {f'p{p}': 1000 * latencies[min(len(latencies) - 1, len(latencies) * p // 100)] for p in ps}
+
+
+class QueryService:
+    """answer (gene, variant) queries with the normalizer, gene symbols
+    and recent results kept in memory
+
+    The results are cleared when the paper table changes, which is checked
+    at most every `version_interval` seconds.
+    """
+    def __init__(self, db_uri=None, cache_size=10000, vcf_cache_size=100000, version_interval=10.0):
+        self.engine = create_engine(db_uri or engine.url, pool_size=8, pool_pre_ping=True)
+        self.var_normalizer = VarNormalizer(cache_size=vcf_cache_size)
+        self.normalizer_lock = threading.Lock()
+        self.gene_ids = self.load_gene_ids()
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.version_interval = version_interval
+        self.index_version = None
+        self.version_checked = 0.0
+        self.stats = LatencyStats()
+        self.paper_cache = query.PaperCache()
+
+    def load_gene_ids(self):
+        """return a dict of lower-cased gene symbol -> gene id of the whole gene table
+
+        Symbols are matched case-insensitively, as by the mysql collation.
+        """
+        gene_ids = dict()
+        with self.engine.connect() as conn:
+            for symbol, gene_id in conn.execute(select([gene.c.symbol, gene.c.id])):
+                gene_ids.setdefault(symbol.lower(), gene_id)
+        logger.info('%d gene symbols loaded', len(gene_ids))
+        return gene_ids
+
+    def get_gene_id(self, gene_name):
+        if gene_name.isdigit():
+            return int(gene_name)
+        return self.gene_ids.get(gene_name.lower())
+
+    def check_index_version(self):
+        """clear the cached results if papers were written since the last check
+        """
+        now = time.time()
+        with self.cache_lock:
+            if now - self.version_checked < self.version_interval:
+                return self.index_version
+            self.version_checked = now
+        with self.engine.connect() as conn:
+            version = query.get_index_version(conn)
+        with self.cache_lock:
+            if version != self.index_version:
+                if self.index_version is not None:
+                    logger.info('paper table changed, %d cached results cleared', len(self.cache))
+                self.cache.clear()
+                self.index_version = version
+            return version
+
+    def _get_cached(self, key):
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+            return None
+
+    def _put_cached(self, key, value, version):
+        with self.cache_lock:
+            if version != self.index_version:
+                return
+            self.cache[key] = value
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def query(self, pairs):
+        """return the result dicts of (gene, variant) pairs
+        """
+        version = self.check_index_version()
+        results = [self._get_cached(pair) for pair in pairs]
+        missing = [pair for pair, ret in zip(pairs, results) if ret is None]
+        if not missing:
+            return results
+
+        var_jsons = dict()
+        for gene_name, variant_name in missing:
+            d = query.parse_variant(variant_name)
+            gene_id = self.get_gene_id(gene_name)
+            if d is not None and gene_id:
+                var_jsons[(gene_name, variant_name)] = (gene_id, json.dumps(d))
+
+        # the normalizer holds one database connection, so it is not shared between threads
+        with self.normalizer_lock, self.var_normalizer.connect():
+            vcfs = self.var_normalizer.to_vcf_batch(var_jsons.values())
+
+        with self.engine.connect() as conn:
+            papers = query.search_vcfs(conn, (vcf for tx_vcfs in vcfs.values() for _, vcf in tx_vcfs))
+
+        new_results = dict()
+        for gene_name, variant_name in missing:
+            gene_id, var_json = var_jsons.get((gene_name, variant_name), (self.get_gene_id(gene_name), None))
+            tx_vcfs = vcfs.get((gene_id, var_json), [])
+            ret = query.make_result(gene_name, variant_name, gene_id, var_json, tx_vcfs, papers)
+            new_results[(gene_name, variant_name)] = ret
+            self._put_cached((gene_name, variant_name), ret, version)
+
+        return [ret if ret is not None else new_results[pair] for pair, ret in zip(pairs, results)]
+
+    def query_region(self, region, limit=100, after=None):
+        """return a page of mentions in a region or a gene, see `query.query_region`
+        """
+        return query.query_region(region, limit, after, db=self.engine, gene_ids=self.gene_ids)
+
+    def query_paper(self, pmid):
+        """return the variants of a paper, cached until the paper is rewritten
+        """
+        return query.query_paper(pmid, db=self.engine, cache=self.paper_cache)
+
+    def get_stats(self):
+        """return latency percentiles and cache statistics
+        """
+        total = self.hits + self.misses
+        return {
+            'requests': self.stats.count,
+            'latency_ms': self.stats.percentiles(),
+            'cache_entries': len(self.cache),
+            'cache_hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """JSON handlers of `QueryService`
+    """
+    service = None
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_query(self, pairs, single):
+        t0 = time.time()
+        try:
+            results = self.service.query(pairs)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception('query failed')
+            self.send_json({'error': str(e)}, status=500)
+            return
+        self.send_json(results[0] if single else results)
+        self.service.stats.add(time.time() - t0)
+
+    def handle_region(self, params):
+        t0 = time.time()
+        try:
+            limit = min(int(params.get('limit', 100)), 10000)
+            result = self.service.query_region(params['region'], limit, params.get('after'))
+        except ValueError:
+            self.send_json({'error': 'invalid limit or cursor'}, status=400)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception('region query failed')
+            self.send_json({'error': str(e)}, status=500)
+            return
+        self.send_json(result)
+        self.service.stats.add(time.time() - t0)
+
+    def handle_paper(self, pmid):
+        t0 = time.time()
+        try:
+            result = self.service.query_paper(pmid)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception('paper query failed')
+            self.send_json({'error': str(e)}, status=500)
+            return
+        self.send_json(result)
+        self.service.stats.add(time.time() - t0)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == '/stats':
+            self.send_json(self.service.get_stats())
+        elif url.path == '/query' and 'gene' in params and 'variant' in params:
+            self.handle_query([(params['gene'], params['variant'])], single=True)
+        elif url.path == '/region' and 'region' in params:
+            self.handle_region(params)
+        elif url.path == '/paper' and 'id' in params:
+            self.handle_paper(params['id'])
+        else:
+            self.send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if urlparse(self.path).path != '/query':
+            self.send_json({'error': 'not found'}, status=404)
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            pairs = [(str(d['gene']), d['variant']) for d in data]
+        except (ValueError, KeyError, TypeError):
+            self.send_json({'error': 'expecting a list of {"gene": ..., "variant": ...}'}, status=400)
+            return
+        self.handle_query(pairs, single=False)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db-uri', type=str, default=None)
+    parser.add_argument('--cache-size', type=int, default=10000)
+    parser.add_argument('--version-interval', type=float, default=10.0,
+                        help='seconds between checks of the paper table for new results')
+    args = parser.parse_args()
+
+    QueryHandler.service = QueryService(args.db_uri, args.cache_size, version_interval=args.version_interval)
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    logger.info('serving on %s:%d', args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
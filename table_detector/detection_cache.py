@@ -0,0 +1,116 @@
+"""persistent cache of detected tables keyed by the page image
+"""
+import os
+import struct
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = b'__version__'
+SEQ_KEY = b'__seq__'
+SIZE_KEY = b'__size__'
+COUNTER = struct.Struct('>Q')
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """return the sha1 hex digest of a file
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class DetectionCache:
+    """LMDB store of sha1(page image) -> dumped table boxes
+
+    The file is cleared when `version` (the model checksum and the
+    detection config) differs from the one it was written with. Entries
+    are evicted in insertion order once their total size is over
+    `max_size` bytes.
+    """
+    def __init__(self, path, version='', max_size=1 << 30, log_every=1000):
+        import lmdb
+
+        self.max_size = max_size
+        self.log_every = log_every
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+        map_size = max(2 * max_size, 1 << 26)
+        self.env = lmdb.open(path, map_size=map_size, subdir=False, max_dbs=2, lock=True)
+        self.boxes_db = self.env.open_db(b'boxes')
+        self.order_db = self.env.open_db(b'order')
+
+        version = version.encode('utf8')
+        with self.env.begin(write=True) as txn:
+            if txn.get(VERSION_KEY) != version:
+                logger.info('clearing table cache %s (version %s)', path, version)
+                txn.drop(self.boxes_db, delete=False)
+                txn.drop(self.order_db, delete=False)
+                txn.put(VERSION_KEY, version)
+                txn.put(SEQ_KEY, COUNTER.pack(0))
+                txn.put(SIZE_KEY, COUNTER.pack(0))
+
+    @staticmethod
+    def digest(img_data):
+        return hashlib.sha1(img_data).digest()
+
+    def get(self, img_data):
+        """return the cached result of the page image, or None
+        """
+        with self.env.begin(db=self.boxes_db) as txn:
+            value = txn.get(self.digest(img_data))
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if (self.hits + self.misses) % self.log_every == 0:
+                self.log_stats()
+        return value
+
+    def put(self, img_data, value):
+        """cache the result of the page image, evicting the oldest entries if full
+        """
+        key = self.digest(img_data)
+        with self.env.begin(write=True) as txn:
+            if txn.get(key, db=self.boxes_db) is not None:
+                return
+            seq = COUNTER.unpack(txn.get(SEQ_KEY))[0] + 1
+            size = COUNTER.unpack(txn.get(SIZE_KEY))[0] + len(value)
+            txn.put(key, value, db=self.boxes_db)
+            txn.put(COUNTER.pack(seq), key, db=self.order_db)
+
+            cursor = txn.cursor(db=self.order_db)
+            cursor.first()
+            while size > self.max_size:
+                old_key = cursor.value()
+                size -= len(txn.get(old_key, db=self.boxes_db))
+                txn.delete(old_key, db=self.boxes_db)
+                cursor.delete()
+
+            txn.put(SEQ_KEY, COUNTER.pack(seq))
+            txn.put(SIZE_KEY, COUNTER.pack(size))
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        if not total:
+            return
+        with self.env.begin(db=self.boxes_db) as txn:
+            n_entries = txn.stat(self.boxes_db)['entries']
+        logger.info('table cache: %d lookups, hit %.1f%%, %d entries',
+                    total, 100 * self.hits / total, n_entries)
+
+
+def open_cache(version):
+    """return the cache configured by TABLE_CACHE_PATH and TABLE_CACHE_SIZE_MB, or None
+    """
+    path = os.environ.get('TABLE_CACHE_PATH', '/app/models/table_detector.cache')
+    if not path:
+        return None
+    max_size = int(os.environ.get('TABLE_CACHE_SIZE_MB', '1024')) << 20
+    return DetectionCache(path, version, max_size)
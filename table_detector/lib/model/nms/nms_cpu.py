@@ -3,7 +3,14 @@ from __future__ import absolute_import
 import numpy as np
 import torch
 
-def nms_cpu(dets, thresh):
+def nms_cpu(dets, thresh, max_keep=None, block_size=64):
+    """greedy NMS, same result as the one box at a time version
+
+    Boxes are visited in blocks of `block_size` in score order: the IoU
+    matrix inside a block resolves the block, then the kept boxes of the
+    block suppress all later boxes with one IoU matrix. With `max_keep`,
+    it stops once that many boxes are kept, returning the same first boxes.
+    """
     dets = dets.numpy()
     x1 = dets[:, 0]
     y1 = dets[:, 1]
@@ -13,22 +20,39 @@ def nms_cpu(dets, thresh):
 
     areas = (x2 - x1 + 1) * (y2 - y1 + 1)
     order = scores.argsort()[::-1]
+    x1, y1, x2, y2, areas = x1[order], y1[order], x2[order], y2[order], areas[order]
 
-    keep = []
-    while order.size > 0:
-        i = order.item(0)
-        keep.append(i)
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
+    def iou(a, b):
+        # IoU matrix of boxes a against boxes b, a and b are indices or slices
+        xx1 = np.maximum(x1[a, None], x1[None, b])
+        yy1 = np.maximum(y1[a, None], y1[None, b])
+        xx2 = np.minimum(x2[a, None], x2[None, b])
+        yy2 = np.minimum(y2[a, None], y2[None, b])
         w = np.maximum(0.0, xx2 - xx1 + 1)
         h = np.maximum(0.0, yy2 - yy1 + 1)
         inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        return inter / (areas[a, None] + areas[None, b] - inter)
 
-        inds = np.where(ovr <= thresh)[0]
-        order = order[inds + 1]
+    n = len(order)
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        block = slice(start, end)
+        ovr = iou(block, block) > thresh
+        block_suppressed = suppressed[start:end]
+        block_keep = []
+        for i in range(end - start):
+            if block_suppressed[i]:
+                continue
+            block_keep.append(start + i)
+            block_suppressed[i + 1:] |= ovr[i, i + 1:]
+        keep += block_keep
+        if max_keep is not None and len(keep) >= max_keep:
+            keep = keep[:max_keep]
+            break
+        rest = np.nonzero(~suppressed[end:])[0] + end
+        if block_keep and len(rest):
+            suppressed[rest] = (iou(np.array(block_keep), rest) > thresh).any(0)
 
-    return torch.IntTensor(keep)
+    return torch.IntTensor(order[keep].tolist())
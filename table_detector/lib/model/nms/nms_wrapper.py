@@ -6,16 +6,26 @@
 # --------------------------------------------------------
 import torch
 from model.utils.config import cfg
-if torch.cuda.is_available():
+try:
     from model.nms.nms_gpu import nms_gpu
+except ImportError:
+    # extension not built by make.sh, use the numpy version
+    nms_gpu = None
 from model.nms.nms_cpu import nms_cpu
 
-def nms(dets, thresh, force_cpu=False):
-    """Dispatch to either CPU or GPU NMS implementations."""
+def nms(dets, thresh, force_cpu=False, max_keep=None):
+    """Dispatch to either CPU or GPU NMS implementations.
+
+    `max_keep` limits the number of kept boxes of the CPU version,
+    the GPU version keeps all of them.
+    """
     if dets.shape[0] == 0:
         return []
     # ---numpy version---
     # original: return gpu_nms(dets, thresh, device_id=cfg.GPU_ID)
     # ---pytorch version---
 
-    return nms_gpu(dets, thresh) if force_cpu == False else nms_cpu(dets, thresh)
+    if force_cpu == False and nms_gpu is not None and dets.is_cuda:
+        return nms_gpu(dets, thresh)
+    keep = nms_cpu(dets.detach().cpu(), thresh, max_keep)
+    return keep.to(dets.device)
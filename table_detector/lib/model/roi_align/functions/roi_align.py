@@ -1,6 +1,47 @@
 import torch
 from torch.autograd import Function
-from .._ext import roi_align
+try:
+    from .._ext import roi_align
+except ImportError:
+    # extension not built by make.sh, forward with roi_align_forward_torch
+    roi_align = None
+
+
+def roi_align_forward_torch(aligned_height, aligned_width, spatial_scale, features, rois):
+    """same output as roi_align_forward of the extension, with tensor ops
+
+    Each output point is bilinearly interpolated at
+    `start + i * (end - start + 1) / (aligned - 1)` of the scaled roi,
+    points outside the feature map are zero.
+    """
+    _, _, height, width = features.size()
+    rois = rois.float()
+    batch_ind = rois[:, 0].long()
+
+    def points(start, end, size, n):
+        start, end = start * spatial_scale, end * spatial_scale
+        bin_size = (end - start + 1).clamp(min=0) / (n - 1.)
+        p = torch.arange(n, dtype=torch.float, device=rois.device)[None, :] * bin_size[:, None] + start[:, None]
+        p0 = torch.clamp(p.floor(), max=size - 2)
+        valid = (p >= 0) & (p < size)
+        ratio = p - p0
+        p0 = p0.long().clamp(min=0, max=size - 1)
+        return p0, (p0 + 1).clamp(max=size - 1), ratio, valid
+
+    h0, h1, h_ratio, h_valid = points(rois[:, 2], rois[:, 4], height, aligned_height)
+    w0, w1, w_ratio, w_valid = points(rois[:, 1], rois[:, 3], width, aligned_width)
+
+    b = batch_ind[:, None, None]
+    h0, h1, h_ratio = h0[:, :, None], h1[:, :, None], h_ratio[:, :, None, None]
+    w0, w1, w_ratio = w0[:, None, :], w1[:, None, :], w_ratio[:, None, :, None]
+    # (num_rois, aligned_height, aligned_width, num_channels)
+    output = (features[b, :, h0, w0] * (1 - h_ratio) * (1 - w_ratio)
+              + features[b, :, h0, w1] * (1 - h_ratio) * w_ratio
+              + features[b, :, h1, w0] * h_ratio * (1 - w_ratio)
+              + features[b, :, h1, w1] * h_ratio * w_ratio)
+    valid = (h_valid[:, :, None] & w_valid[:, None, :])[:, :, :, None]
+    output = output * valid.type_as(output)
+    return output.permute(0, 3, 1, 2).contiguous()
 
 
 # TODO use save_for_backward instead
@@ -19,6 +60,10 @@ class RoIAlignFunction(Function):
         batch_size, num_channels, data_height, data_width = features.size()
         num_rois = rois.size(0)
 
+        if roi_align is None:
+            return roi_align_forward_torch(self.aligned_height, self.aligned_width, self.spatial_scale,
+                                           features, rois)
+
         output = features.new(num_rois, num_channels, self.aligned_height, self.aligned_width).zero_()
         if features.is_cuda:
             roi_align.roi_align_forward_cuda(self.aligned_height,
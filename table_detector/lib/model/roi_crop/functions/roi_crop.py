@@ -1,11 +1,45 @@
 # functions/add.py
 import torch
 from torch.autograd import Function
-from .._ext import roi_crop
+try:
+    from .._ext import roi_crop
+except ImportError:
+    # extension not built by make.sh, forward with bilinear_sampler_torch
+    roi_crop = None
 import pdb
 
+
+def bilinear_sampler_torch(input1, input2):
+    """same output as BilinearSamplerBHWD_updateOutput_cuda, with tensor ops
+
+    `input2` holds the (y, x) sampling points of each roi in [-1, 1],
+    the neighbours outside of the image contribute zero.
+    """
+    batch_size, _, height, width = input1.size()
+    num_rois = input2.size(0)
+    b = (torch.arange(num_rois, device=input2.device) // (num_rois // batch_size))[:, None, None]
+
+    def top_left(coord, size):
+        coord = (coord + 1) * (size - 1) / 2
+        point = coord.floor()
+        return point.long(), 1 - (coord - point)
+
+    y0, y_weight = top_left(input2[:, :, :, 0], height)
+    x0, x_weight = top_left(input2[:, :, :, 1], width)
+
+    output = 0
+    for y, wy in ((y0, y_weight), (y0 + 1, 1 - y_weight)):
+        for x, wx in ((x0, x_weight), (x0 + 1, 1 - x_weight)):
+            inside = ((y >= 0) & (y < height) & (x >= 0) & (x < width)).type_as(input1)
+            # (num_rois, output_height, output_width, num_channels)
+            value = input1[b, :, y.clamp(0, height - 1), x.clamp(0, width - 1)]
+            output = output + value * (wy * wx * inside)[:, :, :, None]
+    return output.permute(0, 3, 1, 2).contiguous()
+
 class RoICropFunction(Function):
     def forward(self, input1, input2):
+        if roi_crop is None or not input1.is_cuda:
+            return bilinear_sampler_torch(input1, input2)
         self.input1 = input1.clone()
         self.input2 = input2.clone()
         output = input2.new(input2.size()[0], input1.size()[1], input2.size()[1], input2.size()[2]).zero_()
@@ -1,8 +1,43 @@
+import math
 import torch
 from torch.autograd import Function
-from .._ext import roi_pooling
+try:
+    from .._ext import roi_pooling
+except ImportError:
+    # extension not built by make.sh, forward with roi_pooling_forward_torch
+    roi_pooling = None
 import pdb
 
+
+def roi_pooling_forward_torch(pooled_height, pooled_width, spatial_scale, features, rois):
+    """same output as roi_pooling_forward_cuda of the extension, with tensor ops
+
+    The max of each bin is taken in two steps, over the rows of a bin
+    then over its columns, empty bins are zero.
+    """
+    _, num_channels, height, width = features.size()
+    output = features.new(rois.size(0), num_channels, pooled_height, pooled_width).zero_()
+    coords = torch.round(rois[:, 1:].float() * spatial_scale).long().tolist()
+    batch_ind = rois[:, 0].long().tolist()
+
+    def bins(start, end, size, n):
+        roi_size = max(end - start + 1, 1)
+        for i in range(n):
+            bin_start = min(max(int(math.floor(i * roi_size / n)) + start, 0), size)
+            bin_end = min(max(int(math.ceil((i + 1) * roi_size / n)) + start, 0), size)
+            yield i, bin_start, bin_end
+
+    for n, ((start_w, start_h, end_w, end_h), b) in enumerate(zip(coords, batch_ind)):
+        w_bins = [(pw, wstart, wend) for pw, wstart, wend in bins(start_w, end_w, width, pooled_width)
+                  if wend > wstart]
+        for ph, hstart, hend in bins(start_h, end_h, height, pooled_height):
+            if hend <= hstart:
+                continue
+            rows = features[b, :, hstart:hend].max(1)[0]
+            for pw, wstart, wend in w_bins:
+                output[n, :, ph, pw] = rows[:, wstart:wend].max(1)[0]
+    return output
+
 class RoIPoolFunction(Function):
     def __init__(ctx, pooled_height, pooled_width, spatial_scale):
         ctx.pooled_width = pooled_width
@@ -17,6 +52,9 @@ class RoIPoolFunction(Function):
         output = features.new(num_rois, num_channels, ctx.pooled_height, ctx.pooled_width).zero_()
         ctx.argmax = features.new(num_rois, num_channels, ctx.pooled_height, ctx.pooled_width).zero_().int()
         ctx.rois = rois
+        if roi_pooling is None:
+            return roi_pooling_forward_torch(ctx.pooled_height, ctx.pooled_width, ctx.spatial_scale,
+                                             features, rois)
         if not features.is_cuda:
             _features = features.permute(0, 2, 3, 1)
             roi_pooling.roi_pooling_forward(ctx.pooled_height, ctx.pooled_width, ctx.spatial_scale,
@@ -145,7 +145,8 @@ class _ProposalLayer(nn.Module):
             # 7. take after_nms_topN (e.g. 300)
             # 8. return the top proposals (-> RoIs top)
 
-            keep_idx_i = nms(torch.cat((proposals_single, scores_single), 1), nms_thresh, force_cpu=not cfg.USE_GPU_NMS)
+            keep_idx_i = nms(torch.cat((proposals_single, scores_single), 1), nms_thresh, force_cpu=not cfg.USE_GPU_NMS,
+                             max_keep=post_nms_topN if post_nms_topN > 0 else None)
             keep_idx_i = keep_idx_i.long().view(-1)
 
             if post_nms_topN > 0:
@@ -4,6 +4,7 @@ import logging
 import os
 import threading
 import io
+import json
 import time
 import random
 
@@ -24,10 +25,14 @@ from model.utils.config import cfg
 from model.utils.blob import im_list_to_blob
 from model.rpn.bbox_transform import clip_boxes
 from model.rpn.bbox_transform import bbox_transform_inv
+from detection_cache import open_cache, file_digest
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_PATH = '/app/models/faster_rcnn.pth'
+SCORE_THRESH = 0.7
+
 
 def load_np(data):
     """load dumped numpy array
@@ -68,8 +73,12 @@ def get_image_blob(im):
     # Prevent the biggest axis from being more than MAX_SIZE
     if np.round(im_scale * im_size_max) > cfg.TEST.MAX_SIZE:
         im_scale = float(cfg.TEST.MAX_SIZE) / float(im_size_max)
-    im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale,
-                    interpolation=cv2.INTER_LINEAR)
+    # images sent by detect_array are already at the input scale
+    if im_scale != 1.0:
+        im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale,
+                        interpolation=cv2.INTER_LINEAR)
+    else:
+        im = im_orig
     im_scale_factors.append(im_scale)
     processed_ims.append(im)
 
@@ -83,12 +92,13 @@ class FasterRCNN:
     """
 
     def load_model(self):
-        checkpoint_path = '/app/models/faster_rcnn.pth'
         self.classes = np.array(['__background__', 'table'])
         self.model = vgg16(self.classes, pretrained=False, class_agnostic=False)
         self.model.create_architecture()
 
-        checkpoint = torch.load(checkpoint_path)
+        # without a gpu, the detector runs on the cpu with the torch versions of the compiled ops
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        checkpoint = torch.load(CHECKPOINT_PATH, map_location=self.device)
         self.model.load_state_dict(checkpoint['model'])
 
         if 'pooling_mode' in checkpoint.keys():
@@ -99,11 +109,11 @@ class FasterRCNN:
         self.num_boxes = torch.LongTensor(1)
         self.gt_boxes = torch.FloatTensor(1)
 
-        self.im_data = self.im_data.cuda()
-        self.im_info = self.im_info.cuda()
-        self.num_boxes = self.num_boxes.cuda()
-        self.gt_boxes = self.gt_boxes.cuda()
-        self.model.cuda()
+        self.im_data = self.im_data.to(self.device)
+        self.im_info = self.im_info.to(self.device)
+        self.num_boxes = self.num_boxes.to(self.device)
+        self.gt_boxes = self.gt_boxes.to(self.device)
+        self.model.to(self.device)
 
         with torch.no_grad():
             self.im_data = Variable(self.im_data)
@@ -113,9 +123,7 @@ class FasterRCNN:
         self.model.eval()
 
     # def detect(self, blobs, im_scales):
-    def detect(self, img_data):
-        np_arr = np.fromstring(img_data, np.uint8)
-        image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    def detect(self, image):
         blobs, im_scales = get_image_blob(image)
 
         im_blob = blobs
@@ -136,8 +144,8 @@ class FasterRCNN:
         boxes = rois.data[:, :, 1:5]
 
         box_deltas = bbox_pred.data
-        box_deltas = box_deltas.view(-1, 4) * torch.FloatTensor(cfg.TRAIN.BBOX_NORMALIZE_STDS).cuda() \
-                   + torch.FloatTensor(cfg.TRAIN.BBOX_NORMALIZE_MEANS).cuda()
+        box_deltas = box_deltas.view(-1, 4) * torch.FloatTensor(cfg.TRAIN.BBOX_NORMALIZE_STDS).to(self.device) \
+                   + torch.FloatTensor(cfg.TRAIN.BBOX_NORMALIZE_MEANS).to(self.device)
         box_deltas = box_deltas.view(1, -1, 4 * len(self.classes))
 
         pred_boxes = bbox_transform_inv(boxes, box_deltas, 1)
@@ -148,8 +156,7 @@ class FasterRCNN:
         scores = scores.squeeze()
         pred_boxes = pred_boxes.squeeze()
 
-        thresh = 0.7
-        inds = torch.nonzero(scores[:, 1] > thresh).view(-1)
+        inds = torch.nonzero(scores[:, 1] > SCORE_THRESH).view(-1)
         cls_dets = []
         if inds.numel() > 0:
             cls_scores = scores[:, 1][inds]
@@ -172,8 +179,12 @@ def worker(que):
 
     while True:
         msg = que.get()
-        img_data, pipe = msg
-        results = faster_rcnn.detect(img_data)
+        img_data, is_array, pipe = msg
+        if is_array:
+            image = load_np(img_data)
+        else:
+            image = cv2.imdecode(np.fromstring(img_data, np.uint8), cv2.IMREAD_COLOR)
+        results = faster_rcnn.detect(image)
         pipe.send(dump_np(results))
 
 
@@ -181,22 +192,53 @@ class TableDetector(rpyc.Service):
     """rpyc service
     """
 
-    def __init__(self, que):
+    def __init__(self, que, cache=None):
         super(TableDetector, self).__init__()
         self.que = que
+        self.cache = cache
         self.pipe = multiprocessing.Pipe()
 
     def exposed_detect(self, img_data):
-        """detect tables in image
+        """detect tables in jpeg image
+        """
+        return self.detect(img_data, False)
+
+    def exposed_detect_array(self, img_data):
+        """detect tables in BGR image array dumped by `dump_np`, already at the input scale
         """
+        return self.detect(img_data, True)
+
+    def detect(self, img_data, is_array):
         t = time.time()
-        self.que.put((img_data, self.pipe[1]))
+        if self.cache is not None:
+            ret = self.cache.get(img_data)
+            if ret is not None:
+                return ret
+        self.que.put((img_data, is_array, self.pipe[1]))
         ret = self.pipe[0].recv()
+        if self.cache is not None:
+            self.cache.put(img_data, ret)
         dt = time.time() - t
         logger.info(f'tables detected. {dt:.3f} secs')
         return ret
 
 
+def cache_version():
+    """return the version of cached results, the checkpoint checksum and the detection config
+    """
+    config = {
+        'scales': cfg.TEST.SCALES,
+        'max_size': cfg.TEST.MAX_SIZE,
+        'pixel_means': cfg.PIXEL_MEANS.tolist(),
+        'nms': cfg.TEST.NMS,
+        'rpn_nms': cfg.TEST.RPN_NMS_THRESH,
+        'rpn_pre_nms_top_n': cfg.TEST.RPN_PRE_NMS_TOP_N,
+        'rpn_post_nms_top_n': cfg.TEST.RPN_POST_NMS_TOP_N,
+        'score_thresh': SCORE_THRESH,
+    }
+    return f'{file_digest(CHECKPOINT_PATH)}:{json.dumps(config, sort_keys=True)}'
+
+
 def main():
     """main
     """
@@ -208,7 +250,8 @@ def main():
         p = multiprocessing.Process(target=worker, args=(que,), daemon=True)
         p.start()
 
-    service = classpartial(TableDetector, que=que)
+    cache = open_cache(cache_version())
+    service = classpartial(TableDetector, que=que, cache=cache)
     t = rpyc.utils.server.ThreadedServer(service, port=18861)
     t.start()
 
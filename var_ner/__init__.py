@@ -17,12 +17,14 @@ logger = logging.getLogger(__name__)
 
 def process(pmid, body, tables, var_extr):
     var_body_mentions = var_extr.extract(body, pmid)
+    return var_body_mentions, process_tables(pmid, tables, var_extr)
 
+
+def process_tables(pmid, tables, var_extr):
     var_table_mentions = []
     for k, t in enumerate(tables):
-        for i, row in enumerate(t['cells']):
-            for j, cell in enumerate(row):
-                mentions = var_extr.extract(cell['text'], pmid)
-                for text, (start, end), var in mentions:
-                    var_table_mentions.append((text, (k, i, j), (start, end), var))
-    return var_body_mentions, var_table_mentions
+        for i, j, cell_text in t['cells'].iter_cells():
+            mentions = var_extr.extract(cell_text, pmid)
+            for text, (start, end), var in mentions:
+                var_table_mentions.append((text, (k, i, j), (start, end), var))
+    return var_table_mentions
@@ -1,8 +1,14 @@
 """CRF features"""
-from typing import List, Dict, Tuple, Pattern
+from typing import List, Dict, Tuple, Pattern, Match, Iterator, FrozenSet, Set, Sequence, Optional
+from array import array
 import re
 import bisect
 
+try:
+    from re import _parser as sre_parse  # python >= 3.11
+except ImportError:
+    import sre_parse
+
 from nltk.tag.api import TaggerI
 
 
@@ -67,24 +73,147 @@ PATTERN_PROTEIN_TRI_SUB = (
 PATTERN_PROTEIN_CHAR = (re.compile(r'^[CISQMNPKDTFAGHLRWVEYX]$'), '-ProteinSymChar-')
 
 
-def get_hgvs_offsets(document: str, patterns: List[Pattern]) -> List[Tuple[int, int]]:
+HGVSOffsets = Tuple[Sequence[int], Sequence[int]]
+
+
+MAX_CHARSET_RANGE = 256
+MAX_PREFILTER_CHARSET = 16
+
+
+def _charset(items) -> Optional[FrozenSet[str]]:
+    """characters of a `[...]` set, None if it cannot be enumerated
+    """
+    chars = set()
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_parse.RANGE and av[1] - av[0] <= MAX_CHARSET_RANGE:
+            chars.update(map(chr, range(av[0], av[1] + 1)))
+        else:
+            return None
+    return frozenset(chars)
+
+
+def _required_chars(parsed) -> Tuple[List[str], List[FrozenSet[str]]]:
+    """collect literal strings and character sets that every match contains
+    """
+    literals, charsets, run = [], [], []
+
+    def flush():
+        if run:
+            literals.append(''.join(run))
+            del run[:]
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+
+        if op is sre_parse.IN:
+            chars = _charset(av)
+            if chars:
+                charsets.append(chars)
+
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            sub_literals, sub_charsets = _required_chars(av[2])
+            literals += sub_literals
+            charsets += sub_charsets
+
+        elif op is sre_parse.SUBPATTERN and not (len(av) == 4 and av[1]):
+            sub_literals, sub_charsets = _required_chars(av[-1])
+            literals += sub_literals
+            charsets += sub_charsets
+
+        elif op is sre_parse.ASSERT:
+            sub_literals, sub_charsets = _required_chars(av[1])
+            literals += sub_literals
+            charsets += sub_charsets
+    flush()
+    return literals, charsets
+
+
+class HGVSPatterns:
+    """compiled tmVar patterns with a literal / character prefilter
+
+    Every pattern is compiled once. The literals and small character sets
+    that any match must contain are derived from the parsed pattern, and
+    patterns sharing the same requirements are checked together, so a
+    sentence without e.g. `p.` or `IVS` skips those patterns entirely.
+    Patterns anchored with `^` can only match at the start and use `match`.
+    """
+
+    def __init__(self, pattern_strs: List[str]):
+        self.anchored = []
+        groups = dict()
+        for pattern_str in pattern_strs:
+            regex = re.compile(pattern_str)
+            parsed = sre_parse.parse(pattern_str)
+            if parsed.data and parsed.data[0] == (sre_parse.AT, sre_parse.AT_BEGINNING):
+                self.anchored.append(regex)
+                continue
+
+            literals, charsets = [], []
+            if not regex.flags & re.IGNORECASE:
+                literals, charsets = _required_chars(parsed)
+            charsets = [c for c in charsets if len(c) <= MAX_PREFILTER_CHARSET]
+            key = (frozenset(literals), frozenset(charsets))
+            groups.setdefault(key, []).append(regex)
+
+        self.groups = [(tuple(literals), tuple(charsets), regexes)
+                       for (literals, charsets), regexes in groups.items()]
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'HGVSPatterns':
+        """load patterns from `*.RegEx.txt`, one pattern per line
+        """
+        with open(filename) as f:
+            return cls([line.strip() for line in f])
+
+    def finditer(self, document: str, chars: Optional[Set[str]] = None) -> Iterator[Match]:
+        """iterate over the matches of all patterns in the document
+
+        Args:
+            document: the sentence
+            chars: characters of `document`, computed if not given
+        """
+        for regex in self.anchored:
+            m = regex.match(document)
+            if m:
+                yield m
+
+        if chars is None:
+            chars = set(document)
+        for literals, charsets, regexes in self.groups:
+            if not all(literal in document for literal in literals):
+                continue
+            if any(chars.isdisjoint(charset) for charset in charsets):
+                continue
+            for regex in regexes:
+                yield from regex.finditer(document)
+
+
+def get_hgvs_offsets(document: str,
+                     patterns: HGVSPatterns,
+                     chars: Optional[Set[str]] = None) -> HGVSOffsets:
     """find offsets in the text that match HGVS patterns
+
+    Returns:
+        sorted start offsets and the end offsets in the same order
     """
-    offsets = []
-    for pattern in patterns:
-        for m in re.finditer(pattern, document):
-            offsets.append((m.start(2), m.end(2)))
+    offsets = [(m.start(2), m.end(2)) for m in patterns.finditer(document, chars)]
     offsets.sort()
-    return offsets
+    return array('l', [start for start, _ in offsets]), array('l', [end for _, end in offsets])
 
 
 def get_hgvs(offset: Tuple[int, int],
-             offsets: List[Tuple[int, int]],
+             offsets: HGVSOffsets,
              name: str) -> str:
     """check the offset of some token in any HGVS mention
     """
-    idx = bisect.bisect_right(offsets, (offset[0], float('inf')))
-    if idx > 0 and offset[0] < offsets[idx - 1][1]:
+    starts, ends = offsets
+    idx = bisect.bisect_right(starts, offset[0])
+    if idx > 0 and offset[0] < ends[idx - 1]:
         return name
     return 'O'
 
@@ -107,9 +236,9 @@ def get_count_features(token: str) -> str:
 
 
 def get_hgvs_feature(offset: Tuple[int, int],
-                     offsets_protein: List[Tuple[int, int]],
-                     offsets_dna: List[Tuple[int, int]],
-                     offsets_snp: List[Tuple[int, int]]) -> str:
+                     offsets_protein: HGVSOffsets,
+                     offsets_dna: HGVSOffsets,
+                     offsets_snp: HGVSOffsets) -> str:
     """whether the token matches any HGVS pattern
     """
     ret = get_hgvs(offset, offsets_protein, 'ProteinMutation')
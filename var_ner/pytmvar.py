@@ -17,6 +17,7 @@ logger = logging.getLogger(__name__)
 PAD_TEXT = 'blablabla, '
 MAX_GENE_LEGNTH = 2305000
 MAX_RNA_LENGTH = 109224
+REGEX_DIR = '/app/models/tmvar_regexes'
 
 
 class Extractor():
@@ -27,9 +28,9 @@ class Extractor():
         self.tagger = CRFPP.Tagger("-m /app/models/MentionExtractionUB.Model")
         self.stemmer = SnowballStemmer('english')
         # self.pos_tagger = PerceptronTagger()
-        self.regex_dna_mutation_str = utils.readlines('/app/models/tmvar_regexes/DNAMutation.RegEx.txt')
-        self.regex_protein_mutation_str = utils.readlines('/app/models/tmvar_regexes/ProteinMutation.RegEx.txt')
-        self.regex_snp_mutation_str = utils.readlines('/app/models/tmvar_regexes/SNP.RegEx.txt')
+        self.regex_dna_mutation = features.HGVSPatterns.from_file(f'{REGEX_DIR}/DNAMutation.RegEx.txt')
+        self.regex_protein_mutation = features.HGVSPatterns.from_file(f'{REGEX_DIR}/ProteinMutation.RegEx.txt')
+        self.regex_snp_mutation = features.HGVSPatterns.from_file(f'{REGEX_DIR}/SNP.RegEx.txt')
 
     def extract(self, text, filename):
         """extract variant mention from text lines
@@ -47,9 +48,10 @@ class Extractor():
         """
         tokens, offsets = utils.tokenize(document)
 
-        offsets_protein = features.get_hgvs_offsets(document, self.regex_protein_mutation_str)
-        offsets_dna = features.get_hgvs_offsets(document, self.regex_dna_mutation_str)
-        offsets_snp = features.get_hgvs_offsets(document, self.regex_snp_mutation_str)
+        chars = set(document)
+        offsets_protein = features.get_hgvs_offsets(document, self.regex_protein_mutation, chars)
+        offsets_dna = features.get_hgvs_offsets(document, self.regex_dna_mutation, chars)
+        offsets_snp = features.get_hgvs_offsets(document, self.regex_snp_mutation, chars)
         # pos_dict = features.get_pos_tags(tokens, self.pos_tagger)
 
         self.tagger.clear()
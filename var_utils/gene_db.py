@@ -33,6 +33,13 @@ def get_gene_tx(conn, gene_id):
     return list(starmap(Transcript, results))
 
 
+def get_annotation_checksum(conn):
+    """return the checksums of the gene and transcript tables, changed when they are reloaded
+    """
+    results = conn.execute('CHECKSUM TABLE gene, transcript')
+    return ','.join(str(checksum) for _, checksum in results)
+
+
 def get_refseq_tx(conn, refseq):
     """return all transcripts belong to the refseq
     """
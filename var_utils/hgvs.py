@@ -6,6 +6,7 @@ from .seqdb import SequenceFileDB
 from .utils import (rna_to_protein, protein_to_rna, three_to_one,
                     rev_p1, revcomp, Position, ChromVariant)
 from .gene_db import get_gene_tx, get_refseq_tx, get_rsid_chromvar, get_gene_chrom
+from .rsid_index import RSIDIndex
 
 logger = logging.getLogger(__name__)
 
@@ -80,10 +81,11 @@ class HGVS:
     """convert hgvs names and some utils
     """
     def __init__(self, db_uri, ref_genome_path,
-                 load_all_genome=False):
+                 load_all_genome=False, rsid_index_path=None):
         self.engine = create_engine(db_uri, pool_pre_ping=True)
         self.load_all_genome = load_all_genome
         self.genome = SequenceFileDB(ref_genome_path, load_all=load_all_genome)
+        self.rsid_index = RSIDIndex(rsid_index_path) if rsid_index_path else None
         self.conn = self.engine.connect()
         self.conn.close()
 
@@ -353,7 +355,11 @@ class HGVS:
     def rsid_to_chrom(self, rsid):
         """return the chromosome variants of the rsid
         """
-        for var in get_rsid_chromvar(self.conn, rsid):
+        if self.rsid_index is not None:
+            chrom_vars = self.rsid_index.get(rsid)
+        else:
+            chrom_vars = get_rsid_chromvar(self.conn, rsid)
+        for var in chrom_vars:
             ref = var.ref.replace('-', '')
             for alt in var.observed.split('/'):
                 alt = alt.replace('-', '')
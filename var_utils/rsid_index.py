@@ -0,0 +1,140 @@
+"""memory-mapped index of dbSNP rsids built from snp150.txt.gz
+
+Usage:
+    python -m var_utils.rsid_index [snp150.txt.gz] [snp150.idx]
+"""
+import os
+import sys
+import gzip
+import mmap
+import time
+import bisect
+import struct
+import logging
+from array import array
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'V2LRS001'
+# magic, little endian, n_records, n_alleles, alleles bytes, n_chroms, chroms bytes
+HEADER = struct.Struct('<8sBxxxxxxxQQQQQ')
+
+
+class RSIDRecord(NamedTuple):
+    """chromosome variant of a rsid, same fields as the mysql `rsid` table uses
+    """
+    chrom: str
+    start: int
+    ref: str
+    observed: str
+
+
+def _pad(n):
+    return b'\0' * (-n % 8)
+
+
+def build(infile='/app/models/snp150.txt.gz', outfile='/app/models/snp150.idx'):  # pylint: disable=too-many-locals
+    """compile snp150 into the records sorted by rsid
+
+    Records are the arrays `names`, `starts`, `alleles` (uint32) and `chroms`
+    (uint16), followed by the offsets and bytes of the distinct
+    "ref\\tobserved" strings and the chromosome names.
+    """
+    import numpy as np
+
+    t0 = time.time()
+    names, starts, alleles, chroms = array('I'), array('I'), array('I'), array('H')
+    allele_ids, chrom_ids = dict(), dict()
+
+    with gzip.open(infile) as f:
+        for i, line in enumerate(f):
+            row = line.split(b'\t', 10)
+            name = row[4][2:]
+            if not name.isdigit():
+                continue
+            names.append(int(name))
+            starts.append(int(row[2]))
+            chroms.append(chrom_ids.setdefault(row[1], len(chrom_ids)))
+            alleles.append(allele_ids.setdefault(row[7] + b'\t' + row[9], len(allele_ids)))
+            if (i + 1) % 10000000 == 0:
+                logger.info('%d rsids read, %.1f secs', i + 1, time.time() - t0)
+
+    # stable, so records of the same rsid keep the file order
+    order = np.argsort(np.frombuffer(names, dtype=np.uint32), kind='mergesort')
+
+    allele_data = b''.join(allele_ids)
+    allele_offsets = array('Q', [0])
+    for allele in allele_ids:
+        allele_offsets.append(allele_offsets[-1] + len(allele))
+    chrom_data = b'\n'.join(chrom_ids)
+
+    tmpfile = f'{outfile}.tmp'
+    with open(tmpfile, 'wb') as fout:
+        fout.write(HEADER.pack(MAGIC, sys.byteorder == 'little', len(names),
+                               len(allele_ids), len(allele_data),
+                               len(chrom_ids), len(chrom_data)))
+        for arr, dtype in ((names, np.uint32), (starts, np.uint32), (alleles, np.uint32), (chroms, np.uint16)):
+            data = np.frombuffer(arr, dtype=dtype)[order].tobytes()
+            fout.write(data + _pad(len(data)))
+        fout.write(allele_offsets.tobytes())
+        fout.write(allele_data + _pad(len(allele_data)))
+        fout.write(chrom_data)
+    os.replace(tmpfile, outfile)
+    logger.info('%d rsids written to %s (%d bytes), %.1f secs',
+                len(names), outfile, os.path.getsize(outfile), time.time() - t0)
+
+
+class RSIDIndex:
+    """look up the chromosome variants of a rsid in the file written by `build`
+    """
+    def __init__(self, path='/app/models/snp150.idx'):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, little, n_records, n_alleles, alleles_len,
+         n_chroms, chroms_len) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or bool(little) != (sys.byteorder == 'little'):
+            raise ValueError(f'{path} is not a rsid index built on this platform')
+
+        buf, offset = memoryview(self._mm), HEADER.size
+
+        def take(n, fmt=None):
+            nonlocal offset
+            view = buf[offset:offset + n]
+            offset += n + (-n % 8)
+            return view.cast(fmt) if fmt else view
+
+        self.names = take(4 * n_records, 'I')
+        self.starts = take(4 * n_records, 'I')
+        self.alleles = take(4 * n_records, 'I')
+        self.chroms = take(2 * n_records, 'H')
+        self.allele_offsets = take(8 * (n_alleles + 1), 'Q')
+        self.allele_data = take(alleles_len)
+        self.chrom_names = str(take(chroms_len), 'ascii').split('\n') if n_chroms else []
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        """return the records of the rsid `rs<number>`
+        """
+        if not name[2:].isdigit():
+            return []
+        number = int(name[2:])
+        names = self.names
+        i = bisect.bisect_left(names, number)
+
+        records = []
+        while i < len(names) and names[i] == number:
+            allele = self.alleles[i]
+            ref, observed = str(self.allele_data[self.allele_offsets[allele]:self.allele_offsets[allele + 1]],
+                                'ascii').split('\t')
+            records.append(RSIDRecord(self.chrom_names[self.chroms[i]], self.starts[i], ref, observed))
+            i += 1
+        return records
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    build(*sys.argv[1:3])
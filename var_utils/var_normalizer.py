@@ -3,24 +3,60 @@
 import os
 import json
 import re
+from collections import defaultdict
+from typing import List, NamedTuple
 
 from .hgvs import HGVS
 from .utils import Position, RNAVariant, ProteinVariant, MTVariant
+from .vcf_cache import VCFCache, canonical_key, genome_version
+from .gene_db import get_annotation_checksum
+
+
+class GeneRecord(NamedTuple):
+    """chromosome and transcripts of a gene, fetched once per batch
+    """
+    chrom: str
+    transcripts: List
 
 
 class VarNormalizer:
     """convert variants to vcf
     """
 
-    def __init__(self, load_all_genome=False):
+    def __init__(self, load_all_genome=False, cache_size=0, cache_path=None,  # pylint: disable=too-many-arguments
+                 rsid_index_path='/app/models/snp150.idx', cache_map_size=1 << 30):
+        """
+        Args:
+            load_all_genome: load the reference genome into memory
+            cache_size: number of conversions cached in memory across papers
+            cache_path: LMDB file of conversions shared across workers, cleared
+                when the genome file or the gene and transcript tables change
+            rsid_index_path: rsid index built by `var_utils.rsid_index`,
+                the mysql `rsid` table is used if it does not exist
+            cache_map_size: maximum size in bytes of the LMDB file at `cache_path`
+        """
+        ref_genome_path = '/app/models/ucsc.hg19.fasta'
+        if rsid_index_path and not os.path.exists(rsid_index_path):
+            rsid_index_path = None
         host = os.environ['MYSQL_HOST']
         port = os.environ['MYSQL_PORT']
         passwd = os.environ['MYSQL_ROOT_PASSWORD']
         db_uri = f'mysql+pymysql://root:{passwd}@{host}:{port}/gene'
 
         self.hgvs = HGVS(db_uri=db_uri,
-                         ref_genome_path='/app/models/ucsc.hg19.fasta',
-                         load_all_genome=load_all_genome)
+                         ref_genome_path=ref_genome_path,
+                         load_all_genome=load_all_genome,
+                         rsid_index_path=rsid_index_path)
+
+        self.cache = None
+        if cache_size > 0 or cache_path:
+            annotation_version = os.environ.get('ANNOTATION_VERSION', '')
+            if cache_path:
+                # the transcripts of to_vcf come from mysql, the file would outlive a reload
+                with self.hgvs.engine.connect() as conn:
+                    annotation_version += ':' + get_annotation_checksum(conn)
+            version = genome_version(ref_genome_path, annotation_version)
+            self.cache = VCFCache(cache_size, cache_path, version, cache_map_size)
 
     def connect(self):
         """return a Connection object
@@ -128,7 +164,21 @@ class VarNormalizer:
 
         return RNAVariant(mut_type, start, end, ref, alt, dup)
 
-    def to_vcf_protein(self, gene_ids, var_dict):
+    def get_gene_tx(self, gene_id, genes=None):
+        """return all transcripts in the gene, from `genes` if prefetched
+        """
+        if genes and gene_id in genes:
+            return genes[gene_id].transcripts
+        return self.hgvs.get_gene_tx(gene_id)
+
+    def get_gene_chrom(self, gene_id, genes=None):
+        """return the chromosome of the gene, from `genes` if prefetched
+        """
+        if genes and gene_id in genes:
+            return genes[gene_id].chrom
+        return self.hgvs.get_gene_chrom(gene_id)
+
+    def to_vcf_protein(self, gene_ids, var_dict, genes=None):
         """convert protein var to vcf
         """
         if not var_dict['start'].isdigit():
@@ -138,7 +188,7 @@ class VarNormalizer:
         ref, alt = var_dict['wild_type'], var_dict['mutant']
         protein_var = ProteinVariant(start, ref, alt)
         for gene_id in gene_ids:
-            for tx in self.hgvs.get_gene_tx(gene_id):
+            for tx in self.get_gene_tx(gene_id, genes):
                 for vcf in self.hgvs.protein_to_chrom(tx, protein_var):
                     yield (tx.name, vcf)
 
@@ -172,16 +222,16 @@ class VarNormalizer:
             yield ('Mitochondrial', vcf)
 
 
-    def to_vcf_rna(self, gene_ids, var_dict, fix=True):
+    def to_vcf_rna(self, gene_ids, var_dict, fix=True, genes=None):
         """convert rna var to vcf
         """
         for gene_id in gene_ids:
-            chrom = self.hgvs.get_gene_chrom(gene_id)
+            chrom = self.get_gene_chrom(gene_id, genes)
             if chrom == 'MT':
                 yield from self.to_vcf_mt(var_dict, fix)
                 return
 
-            for tx in self.hgvs.get_gene_tx(gene_id):
+            for tx in self.get_gene_tx(gene_id, genes):
                 var = self.parse_rna_var(tx, var_dict, fix)
                 if not var:
                     continue
@@ -194,12 +244,11 @@ class VarNormalizer:
         for vcf in self.hgvs.rsid_to_chrom(rsid):
             yield ('', vcf)
 
-    def to_vcf(self, gene_ids, var_json, fix=True):
+    def to_vcf(self, gene_ids, var_json, fix=True, genes=None):
         """convert variant json to vcf
         """
         var = json.loads(var_json)
 
-
         if var['mut_type'] == 'VCF':
             chrom = var['chrom']
             position = int(var['position'])
@@ -211,10 +260,10 @@ class VarNormalizer:
             var['mut_type'] = var['mut_type'][5:]
             rsid_vcfs = set(self.to_vcf_rsid(var['rsid']))
             if 'seq_types' in var and 'p' in var['seq_types'] and var['mut_type'] == 'SUB':
-                hgvs_vcfs = set(self.to_vcf_protein(gene_ids, var))
+                hgvs_vcfs = set(self.to_vcf_protein(gene_ids, var, genes))
 
             elif 'seq_types' in var and {'c', 'n', 'r'} & set(var['seq_types']):
-                hgvs_vcfs = set(self.to_vcf_rna(gene_ids, var, fix))
+                hgvs_vcfs = set(self.to_vcf_rna(gene_ids, var, fix, genes))
 
             elif 'seq_types' in var and {'m'} & set(var['seq_types']):
                 hgvs_vcfs = set(self.to_vcf_mt(var))
@@ -229,10 +278,51 @@ class VarNormalizer:
 
         # for protein, only supporting substitution
         elif 'seq_types' in var and 'p' in var['seq_types'] and var['mut_type'] == 'SUB':
-            yield from self.to_vcf_protein(gene_ids, var)
+            yield from self.to_vcf_protein(gene_ids, var, genes)
 
         elif 'seq_types' in var and {'c', 'n', 'r'} & set(var['seq_types']):
-            yield from self.to_vcf_rna(gene_ids, var, fix)
+            yield from self.to_vcf_rna(gene_ids, var, fix, genes)
 
         elif 'seq_types' in var and {'m'} & set(var['seq_types']):
             yield from self.to_vcf_mt(var)
+
+    def to_vcf_batch(self, pairs, fix=True):
+        """convert (gene_id, variant json) pairs to vcfs
+
+        Duplicated pairs are converted once, and the transcripts of each
+        gene are fetched once for all its variants. Conversions found in
+        `self.cache` are not recomputed, new ones are written to its file
+        in one transaction at the end.
+
+        Returns:
+            dict of (gene_id, var_json) -> list of (transcript name, vcf),
+            same as `list(to_vcf([gene_id], var_json))`
+        """
+        gene_vars = defaultdict(dict)
+        for gene_id, var_json in pairs:
+            gene_vars[gene_id][var_json] = None
+
+        ret = dict()
+        try:
+            for gene_id, var_jsons in gene_vars.items():
+                genes = None
+                for var_json in var_jsons:
+                    cache_key = None
+                    if self.cache is not None:
+                        cache_key = canonical_key(gene_id, var_json, fix)
+                        vcfs = self.cache.get(cache_key)
+                        if vcfs is not None:
+                            ret[(gene_id, var_json)] = vcfs
+                            continue
+
+                    if genes is None:
+                        genes = {gene_id: GeneRecord(self.hgvs.get_gene_chrom(gene_id),
+                                                     self.hgvs.get_gene_tx(gene_id))}
+                    vcfs = list(self.to_vcf([gene_id], var_json, fix, genes))
+                    ret[(gene_id, var_json)] = vcfs
+                    if cache_key is not None:
+                        self.cache.put(cache_key, vcfs)
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+        return ret
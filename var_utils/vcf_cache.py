@@ -0,0 +1,127 @@
+"""cache of variant to vcf conversions shared across papers
+"""
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = b'__version__'
+
+
+def canonical_key(gene_id, var_json, fix):
+    """return the cache key of a conversion, independent of the json key order
+    """
+    var_json = json.dumps(json.loads(var_json), sort_keys=True, separators=(',', ':'))
+    return (gene_id, var_json, fix)
+
+
+class VCFCache:
+    """bounded LRU of (gene_id, var_json, fix) -> [(transcript name, vcf), ...]
+
+    With `path`, entries are also stored in an LMDB file of at most `map_size`
+    bytes shared by the workers. The file is cleared when `version` (the genome
+    and annotation version) differs from the one it was written with. Once the
+    file is full, new entries are kept in memory only. New entries are written
+    to the file in one transaction by `flush`.
+    """
+    def __init__(self, maxsize=100000, path=None, version='', map_size=1 << 30):
+        self.maxsize = maxsize
+        self.version = version
+        self.memory = OrderedDict()
+        self.hits = self.disk_hits = self.misses = 0
+        self.env = None
+        self.disk_full = False
+        self.pending = dict()
+        if path:
+            self._open_disk(path, map_size)
+
+    def _open_disk(self, path, map_size):
+        import lmdb
+
+        self.map_full_error = lmdb.MapFullError
+        self.env = lmdb.open(path, map_size=map_size, subdir=False, lock=True)
+        version = self.version.encode('utf8')
+        with self.env.begin(write=True) as txn:
+            if txn.get(VERSION_KEY) != version:
+                logger.info('clearing vcf cache %s (version %s)', path, self.version)
+                txn.drop(self.env.open_db(), delete=False)
+                txn.put(VERSION_KEY, version)
+
+    @staticmethod
+    def _disk_key(key):
+        return hashlib.sha1(repr(key).encode('utf8')).digest()
+
+    def get(self, key):
+        """return the cached vcfs of the key, or None
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        if self.env is not None:
+            disk_key = self._disk_key(key)
+            data = self.pending.get(disk_key)
+            if data is None:
+                with self.env.begin() as txn:
+                    data = txn.get(disk_key)
+            if data is not None:
+                value = [(tx_name, tuple(vcf)) for tx_name, vcf in json.loads(data.decode('utf8'))]
+                self._put_memory(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """cache the vcfs of the key, in the file after the next `flush`
+        """
+        self._put_memory(key, value)
+        if self.env is not None and not self.disk_full:
+            self.pending[self._disk_key(key)] = json.dumps(value).encode('utf8')
+
+    def flush(self):
+        """write the new entries to the file
+        """
+        if not self.pending:
+            return
+        try:
+            with self.env.begin(write=True) as txn:
+                for disk_key, data in self.pending.items():
+                    txn.put(disk_key, data)
+        except self.map_full_error:
+            logger.warning('vcf cache %s is full, new entries are kept in memory only', self.env.path())
+            self.disk_full = True
+        self.pending.clear()
+
+    def _put_memory(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def log_stats(self):
+        """log hit rates since the cache is created
+        """
+        total = self.hits + self.disk_hits + self.misses
+        if not total:
+            return
+        logger.info('vcf cache: %d lookups, memory hit %.1f%%, disk hit %.1f%%, %d entries',
+                    total, 100 * self.hits / total, 100 * self.disk_hits / total, len(self.memory))
+
+
+def genome_version(ref_genome_path, annotation_version=''):
+    """return a version string of the reference genome file and the annotation
+    """
+    try:
+        stat = os.stat(ref_genome_path)
+        genome = f'{stat.st_size}:{int(stat.st_mtime)}'
+    except OSError:
+        genome = ''
+    return f'{genome}:{annotation_version}'